@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+TRADING_DAYS = 252
+ROLLING_WINDOW = 252        # one year of daily returns
+REPORT_DIR = "backtest_report"
+
+# Every function below works along the last axis, so ``values`` can be one run
+# (T,) or a batch of runs stacked into (runs, T) and they are all computed at once.
+
+
+def daily_returns(values):
+    values = np.asarray(values, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return values[..., 1:] / values[..., :-1] - 1
+
+
+def _ratio(num, den):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(den > 0, num / den, np.nan)
+
+
+def cagr(values, periods_per_year=TRADING_DAYS):
+    values = np.asarray(values, dtype='float64')
+    years = (values.shape[-1] - 1) / periods_per_year
+    if years <= 0:
+        return np.full(values.shape[:-1], np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (values[..., -1] / values[..., 0]) ** (1 / years) - 1
+
+
+def volatility(returns, periods_per_year=TRADING_DAYS):
+    return np.std(returns, axis=-1, ddof=1) * np.sqrt(periods_per_year)
+
+
+def sharpe(returns, risk_free=0.0, periods_per_year=TRADING_DAYS):
+    excess = returns - risk_free / periods_per_year
+    return _ratio(excess.mean(axis=-1), excess.std(axis=-1, ddof=1)) * np.sqrt(periods_per_year)
+
+
+def sortino(returns, risk_free=0.0, periods_per_year=TRADING_DAYS):
+    excess = returns - risk_free / periods_per_year
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2, axis=-1))
+    return _ratio(excess.mean(axis=-1), downside) * np.sqrt(periods_per_year)
+
+
+def drawdowns(values):
+    values = np.asarray(values, dtype='float64')
+    return values / np.maximum.accumulate(values, axis=-1) - 1
+
+
+def max_drawdown(values):
+    """Deepest drawdown and the longest stretch (in periods) spent below a previous peak."""
+    drawdown = drawdowns(values)
+    steps = np.broadcast_to(np.arange(drawdown.shape[-1]), drawdown.shape)
+    last_peak = np.maximum.accumulate(np.where(drawdown < 0, 0, steps), axis=-1)
+    return drawdown.min(axis=-1), (steps - last_peak).max(axis=-1)
+
+
+def daily_turnover(weights, rebalanced=None):
+    """One-way turnover per period from a (..., T, N) weight history.
+
+    Weight changes between rebalances are only price drift, so pass the
+    rebalance flags to count trading days alone.
+    """
+    weights = np.asarray(weights, dtype='float64')
+    turnover = np.zeros(weights.shape[:-1])
+    turnover[..., 1:] = 0.5 * np.abs(np.diff(weights, axis=-2)).sum(axis=-1)
+    if rebalanced is not None:
+        turnover = np.where(rebalanced, turnover, 0.0)
+    return turnover
+
+
+def annual_turnover(turnover, periods_per_year=TRADING_DAYS):
+    return np.sum(turnover, axis=-1) / (np.shape(turnover)[-1] / periods_per_year)
+
+
+# ------------ Whole-period summary ------------
+
+def summarize(values, turnover=None, periods_per_year=TRADING_DAYS):
+    """``{metric: value}`` for one run, or ``{metric: array over runs}`` for a batch."""
+    returns = daily_returns(values)
+    drawdown, duration = max_drawdown(values)
+    return {
+        'cagr': cagr(values, periods_per_year),
+        'volatility': volatility(returns, periods_per_year),
+        'sharpe': sharpe(returns, periods_per_year=periods_per_year),
+        'sortino': sortino(returns, periods_per_year=periods_per_year),
+        'max_drawdown': drawdown,
+        'drawdown_days': duration,
+        'turnover': np.nan if turnover is None else annual_turnover(turnover, periods_per_year),
+    }
+
+
+# Function to summarize many runs of equal length in one vectorized pass
+# ``values`` is (runs, T) and ``turnover`` (runs, T); returns one row per run.
+def batch_summary(values, turnover=None, names=None, periods_per_year=TRADING_DAYS):
+    values = np.atleast_2d(np.asarray(values, dtype='float64'))
+    table = pd.DataFrame(summarize(values, turnover, periods_per_year), index=names)
+    table.insert(0, 'final_value', values[:, -1])
+    return table
+
+
+# Function to summarize saved runs (results_io directories) in chunks of equal-length runs
+def summarize_saved(paths, chunk_size=1000):
+    from results_io import load_results
+
+    rows = []
+    for first in range(0, len(paths), chunk_size):
+        chunk = paths[first:first + chunk_size]
+        runs = [load_results(p) for p in chunk]
+        by_length = {}
+        for p, run in zip(chunk, runs):
+            by_length.setdefault(len(run.values), []).append((p, run))
+        for group in by_length.values():
+            values = np.stack([run.values for _, run in group])
+            turnover = None
+            if all('turnover' in run.series for _, run in group):
+                turnover = np.stack([run.series['turnover'] for _, run in group])
+            rows.append(batch_summary(values, turnover, names=[p for p, _ in group]))
+    return pd.concat(rows).reindex(paths) if rows else pd.DataFrame()
+
+
+# ------------ Rolling metrics ------------
+
+def _rolling_sum(x, window):
+    # Sums over trailing windows along the last axis; the first window-1 entries are NaN
+    csum = np.cumsum(x, axis=-1)
+    out = np.full(x.shape, np.nan)
+    out[..., window - 1] = csum[..., window - 1]
+    out[..., window:] = csum[..., window:] - csum[..., :-window]
+    return out
+
+
+def rolling_metrics(values, turnover=None, window=ROLLING_WINDOW, periods_per_year=TRADING_DAYS):
+    """Trailing-window versions of the summary metrics for one run, aligned to ``values``.
+
+    Mean and variance come from running sums, so every metric except the
+    drawdown is O(T); the drawdown uses a strided view over the windows.
+    """
+    values = np.asarray(values, dtype='float64')
+    returns = np.concatenate([[np.nan], daily_returns(values)])
+    clean = np.nan_to_num(returns)
+    n = _rolling_sum(np.isfinite(returns).astype('float64'), window)
+    mean = _rolling_sum(clean, window) / n
+    var = (_rolling_sum(clean ** 2, window) - n * mean ** 2) / (n - 1)
+    downside = np.sqrt(_rolling_sum(np.minimum(clean, 0.0) ** 2, window) / n)
+    vol = np.sqrt(np.clip(var, 0.0, None))
+    scale = np.sqrt(periods_per_year)
+
+    frame = {
+        'return': np.full(len(values), np.nan),
+        'volatility': vol * scale,
+        'sharpe': _ratio(mean, vol) * scale,
+        'sortino': _ratio(mean, downside) * scale,
+        'max_drawdown': np.full(len(values), np.nan),
+        'turnover': np.nan,
+    }
+    if turnover is not None:
+        frame['turnover'] = _rolling_sum(np.asarray(turnover, dtype='float64'), window) * periods_per_year / window
+    if len(values) > window:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frame['return'][window:] = (values[window:] / values[:-window]) ** (periods_per_year / window) - 1
+        windows = sliding_window_view(values, window + 1)
+        frame['max_drawdown'][window:] = (windows / np.maximum.accumulate(windows, axis=-1) - 1).min(axis=-1)
+    return pd.DataFrame(frame)
+
+
+# ------------ Report ------------
+
+def _plain(value):
+    value = np.asarray(value).item()
+    return None if isinstance(value, float) and not np.isfinite(value) else value
+
+
+# Function to write a headless report: summary.json, rolling.csv and charts as PNG
+# Nothing is shown on screen; the charts use matplotlib's Figure directly, which needs no display.
+def write_report(dates, values, turnover=None, path=REPORT_DIR, window=ROLLING_WINDOW):
+    from matplotlib.figure import Figure
+
+    os.makedirs(path, exist_ok=True)
+    dates = pd.DatetimeIndex(dates)
+    summary = {name: _plain(v) for name, v in summarize(values, turnover).items()}
+    summary.update(start=str(dates[0].date()), end=str(dates[-1].date()),
+                   start_value=float(values[0]), final_value=float(values[-1]))
+    with open(os.path.join(path, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=1)
+
+    rolling = rolling_metrics(values, turnover, window)
+    rolling.index = dates
+    rolling.insert(0, 'drawdown', drawdowns(values))
+    rolling.insert(0, 'PortfolioValue', values)
+    rolling.to_csv(os.path.join(path, "rolling.csv"), index_label='Date')
+
+    fig = Figure(figsize=(10, 8))
+    ax_value, ax_drawdown, ax_sharpe = fig.subplots(3, 1, sharex=True)
+    ax_value.plot(dates, values)
+    ax_value.set_title("Portfolio Value Over Time")
+    ax_drawdown.fill_between(dates, rolling['drawdown'], 0, color='tab:red', alpha=0.4)
+    ax_drawdown.set_title("Drawdown")
+    ax_sharpe.plot(dates, rolling['sharpe'])
+    ax_sharpe.set_title(f"Rolling {window}-day Sharpe")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(os.path.join(path, "performance.png"), dpi=100)
+    return summary
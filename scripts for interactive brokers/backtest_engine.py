@@ -0,0 +1,392 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from data_fetcher import optimize_portfolio, MAX_ASSET_WEIGHT, MIN_GROUP_WEIGHT, MOMENTUM_WINDOW
+from fundamentals import fundamentals_on
+from optimizer_session import OptimizerSession
+from covariance import CovarianceEngine
+from constraints import ConstraintSet
+from drift_monitor import DriftMonitor, price_returns
+from results_io import save_results, RESULTS_DIR
+from rolling_window import RollingWindow
+from costs import CostModel, average_daily_volume
+from price_store import ADJUSTMENT_TOLERANCE
+
+
+HISTORY_DAYS = 365          # calendar days of prices each rebalance looks back over
+INIT_HISTORY_ROWS = 252     # rows used for the opening allocation
+WINDOW_MARGIN_ROWS = 21     # rows beyond the momentum lookback a window always holds
+MIN_COVERAGE = 0.8          # share of the window a ticker needs to be priced on
+CHECKPOINT_PATH = "backtest_checkpoint.npz"
+RESULT_ARRAYS = ('values', 'weights', 'rebalanced', 'turnover', 'trading_costs', 'cash_history')
+
+
+class BacktestEngine:
+    """Daily buy-and-hold backtest with constraint-triggered rebalances.
+
+    Prices and holdings are NumPy arrays over one fixed asset index (the price
+    frame's columns) and the rules are a compiled ConstraintSet, so a day is a
+    handful of vector operations. Results go into arrays preallocated for the
+    whole run; nothing is formatted until export.
+
+    The portfolio is whole shares plus a cash balance. Each rebalance trades the
+    difference to the new share counts at that day's prices and pays the
+    ``cost_model``'s commissions, spread and impact out of cash (a plain
+    CostModel is free). ``volume`` (date x ticker) feeds the impact term's
+    average daily volume. A holding is valued at the last known price of its
+    ticker, and one without a bar on a rebalance day is left as it is.
+
+    Between rebalances the weights are carried forward from daily returns by a
+    DriftMonitor, which calls for a rebalance when a rule breaks or, with a
+    ``drift_band``, when a weight drifts that far from its last target.
+
+    A ``turnover_penalty`` or ``max_turnover`` makes the optimizer trade-aware
+    (see OptimizerSession): each rebalance starts from the drifted weights and
+    pays for, or is limited in, the turnover away from them. Orders worth less
+    than ``min_trade_value`` are skipped unless they close a position.
+
+    With a sim_broker.SimBroker as ``broker`` the rebalances are not sized
+    here: they go through trader.rebalance_portfolio against the simulated
+    account, and holdings and cash are read back from its fills.
+    """
+
+    def __init__(self, prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask, etf_tickers,
+                 initial_capital, momentum_lookback=MOMENTUM_WINDOW, covariance_method='sample',
+                 max_weight=MAX_ASSET_WEIGHT, min_group_weight=MIN_GROUP_WEIGHT, factor_weights=None,
+                 cost_model=None, volume=None, broker=None, opt_cache=None, session=None, cov_engine=None,
+                 drift_band=None, turnover_penalty=0.0, max_turnover=None, min_trade_value=0.0, verbose=True):
+        self.prices = prices
+        self.market_caps = market_caps
+        self.pe_ratios = pe_ratios
+        self.dates = prices.index
+        self.assets = prices.columns
+        self.initial_capital = initial_capital
+        if momentum_lookback + 1 > len(prices):
+            raise ValueError(f"momentum_lookback={momentum_lookback} needs more than the {len(prices)} price rows")
+        self.momentum_lookback = momentum_lookback
+        self.covariance_method = covariance_method
+        self.max_weight = max_weight
+        self.min_group_weight = min_group_weight
+        self.factor_weights = factor_weights
+        self.drift_band = drift_band
+        self.turnover_penalty = turnover_penalty
+        self.max_turnover = max_turnover
+        self.min_trade_value = min_trade_value
+        self.cost_model = cost_model or CostModel()
+        self.broker = broker
+        self.opt_cache = opt_cache
+        self.verbose = verbose
+
+        # Raw prices size new positions (no trade without a bar that day);
+        # forward-filled prices value the ones already held
+        self.trade_prices = prices.to_numpy(dtype='float64')
+        self.mark_prices = np.nan_to_num(prices.ffill().to_numpy(dtype='float64'), nan=0.0)
+        self.adv = None
+        if volume is not None:
+            self.adv = average_daily_volume(volume).reindex(index=self.dates, columns=self.assets).to_numpy(dtype='float64')
+        self.constraints = ConstraintSet.for_universe(
+            self.assets,
+            small_cap_mask.reindex(index=self.dates, columns=self.assets, fill_value=False),
+            large_cap_mask.reindex(index=self.dates, columns=self.assets, fill_value=False),
+            etf_tickers, max_weight=max_weight, min_group_weight=min_group_weight)
+        self.monitor = DriftMonitor(self.assets, self.constraints, drift_band)
+
+        # One compiled max-Sharpe problem shared by every rebalance, and running
+        # covariance sums that only move by the days between rebalances
+        self.session = session or OptimizerSession(self.assets, max_weight, min_group_weight,
+                                                   turnover_penalty=turnover_penalty, max_turnover=max_turnover)
+        self.cov_engine = cov_engine or CovarianceEngine.from_prices(prices)
+        self.window = RollingWindow(prices)
+
+        n_days, n_assets = self.trade_prices.shape
+        self.holdings = np.zeros(n_assets, dtype='int64')
+        self.cash = float(initial_capital)
+        self.values = np.full(n_days, np.nan)
+        self.weights = np.zeros((n_days, n_assets))
+        self.rebalanced = np.zeros(n_days, dtype=bool)
+        self.turnover = np.zeros(n_days)    # one-way turnover traded on each day
+        self.trading_costs = np.zeros(n_days)
+        self.cash_history = np.zeros(n_days)
+        self.position = 0           # next row to simulate
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    # ------------ Rebalancing ------------
+
+    def _to_vector(self, weights):
+        vector = np.zeros(len(self.assets))
+        vector[self.assets.get_indexer(list(weights))] = list(weights.values())
+        return vector
+
+    def _replay_trade(self, weights, i):
+        adv = None if self.adv is None else dict(zip(self.assets, self.adv[i]))
+        self.broker.set_prices(dict(zip(self.assets, self.trade_prices[i])), self.dates[i], adv,
+                               marks=dict(zip(self.assets, self.mark_prices[i])))
+        cost = self.broker.rebalance(dict(zip(self.assets, weights)), self.min_trade_value, self.verbose)
+        positions = self.broker.positions
+        self.holdings = np.array([int(positions.get(tk, 0)) for tk in self.assets], dtype='int64')
+        self.cash = self.broker.cash
+        return cost
+
+    def _trade(self, weights, i, capital):
+        """Trade to whole-share ``weights`` of ``capital`` at day i's prices; returns the costs paid."""
+        if self.broker is not None:
+            return self._replay_trade(weights, i)
+        price = self.trade_prices[i]
+        tradable = price > 0
+        adv = None if self.adv is None else self.adv[i]
+        # Positions without a bar today cannot be traded, so their value is not reinvested
+        capital -= self.holdings[~tradable] @ self.mark_prices[i][~tradable]
+        holdings = self.holdings.copy()
+        cost = 0.0
+        for _ in range(2):
+            # Second pass sizes on capital net of the first pass's costs, so cash stays >= 0
+            holdings[tradable] = ((capital - cost) * weights[tradable] / price[tradable]).astype('int64')
+            if self.min_trade_value > 0:
+                small = (np.abs(holdings - self.holdings) * price < self.min_trade_value) & (holdings != 0)
+                holdings[small] = self.holdings[small]
+            trades = holdings - self.holdings
+            cost = self.cost_model.total(trades, price, adv)
+            if cost == 0:
+                break
+        if self.min_trade_value > 0:
+            # Skipped sells do not raise the cash the buys were sized on; scale the buys down to fit
+            buys = tradable & (trades > 0)
+            spend = trades[buys] @ price[buys]
+            shortfall = trades[tradable] @ price[tradable] + cost - self.cash
+            if shortfall > 0 and spend > 0:
+                scale = max(spend - shortfall, 0.0) / spend
+                holdings[buys] = self.holdings[buys] + (trades[buys] * scale).astype('int64')
+                trades = holdings - self.holdings
+                cost = self.cost_model.total(trades, price, adv)
+        self.cash -= trades[tradable] @ price[tradable] + cost
+        self.holdings = holdings
+        return cost
+
+    def _current_weights(self):
+        # Drifted weights the optimizer trades away from; only a trade-aware session uses them
+        if not self.session.trade_aware:
+            return None
+        return pd.Series(self.monitor.weights, index=self.assets)
+
+    def _held_weights(self, i):
+        value = self.holdings * self.mark_prices[i]
+        total = value.sum() + self.cash
+        return value / total if total > 0 else np.zeros(len(self.assets))
+
+    def _window_rows(self):
+        # Rows a window needs so that a lookback longer than HISTORY_DAYS still has a momentum
+        return self.momentum_lookback + 1 + WINDOW_MARGIN_ROWS
+
+    def initialize(self):
+        date = self.dates[0]
+        init_weights = optimize_portfolio(self.prices.iloc[:max(INIT_HISTORY_ROWS, self._window_rows())],
+                                          fundamentals_on(self.market_caps, self.pe_ratios, date),
+                                          self.factor_weights, session=self.session,
+                                          cov_method=self.covariance_method, momentum_window=self.momentum_lookback,
+                                          cache=self.opt_cache)
+        self.holdings = np.zeros(len(self.assets), dtype='int64')
+        self.cash = float(self.initial_capital) if self.broker is None else self.broker.cash
+        target = self._to_vector(init_weights)
+        self.turnover[0] = 0.5 * np.abs(target).sum()     # bought from cash
+        self.trading_costs[0] += self._trade(target, 0, self.initial_capital)
+        self.monitor.reset(self._held_weights(0), target)
+        self.rebalanced[0] = True
+        self.position = 0
+
+    def target_weights(self, i):
+        """Optimizer weights for day ``i`` as a vector over ``assets``, or None."""
+        date = self.dates[i]
+        window_start = date - pd.Timedelta(days=HISTORY_DAYS)
+        start = min(self.dates.searchsorted(window_start), max(i + 1 - self._window_rows(), 0))
+        window = self.window.move(start, i + 1)
+        if len(window) < self.momentum_lookback + 1:
+            self._log(f"[WARN] Insufficient history ({len(window)}) at {date.date()}")
+            return None
+        complete = window.complete(MIN_COVERAGE)
+        if not complete.any():
+            self._log(f"[WARN] No valid price columns at {date.date()}")
+            return None
+        valid_cols = self.assets[complete]
+        fund_flds = fundamentals_on(self.market_caps, self.pe_ratios, date, valid_cols)
+        if not fund_flds:
+            self._log(f"[WARN] No valid fundamentals at {date.date()}")
+            return None
+        # Return rows inside the window start one row after its first price
+        S = self.cov_engine.roll(start + 1, i + 1).covariance(self.covariance_method, valid_cols)
+        momentum = window.momentum(self.momentum_lookback)[complete]
+        try:
+            new_weights = optimize_portfolio(window.frame(), fund_flds, self.factor_weights, session=self.session,
+                                             cov=S, momentum=momentum, cache=self.opt_cache,
+                                             current_weights=self._current_weights())
+        except Exception as e:
+            self._log(f"[WARN] Optimization failed at {date.date()}: {e}")
+            return None
+        return self._to_vector(new_weights)
+
+    # ------------ Simulation ------------
+
+    def step(self):
+        i = self.position
+        if i > 0:
+            self.monitor.drift(price_returns(self.mark_prices[i], self.mark_prices[i - 1]))
+        weights = self.monitor.weights
+        reason = self.monitor.check(i)
+        if reason is not None:
+            self._log(f"[REBALANCE] at {self.dates[i].date()} ({reason})")
+            target = self.target_weights(i)
+            if target is not None:
+                total = (self.holdings * self.mark_prices[i]).sum() + self.cash
+                self.turnover[i] = 0.5 * np.abs(target - weights).sum()
+                self.trading_costs[i] += self._trade(target, i, total)
+                self.monitor.reset(self._held_weights(i), target)
+                weights = target
+                self.rebalanced[i] = True
+        self.values[i] = self.holdings @ self.mark_prices[i] + self.cash
+        self.cash_history[i] = self.cash
+        self.weights[i] = weights
+        self.position += 1
+
+    def run(self):
+        if self.position == 0:
+            self.initialize()
+        while self.position < len(self.dates):
+            self.step()
+        return self
+
+    # ------------ Checkpoints ------------
+
+    def _config(self):
+        # Settings a checkpoint is only valid for
+        return {'initial_capital': self.initial_capital, 'momentum_lookback': self.momentum_lookback,
+                'covariance_method': self.covariance_method, 'max_weight': self.max_weight,
+                'min_group_weight': self.min_group_weight, 'factor_weights': self.factor_weights,
+                'drift_band': self.drift_band, 'turnover_penalty': self.turnover_penalty,
+                'max_turnover': self.max_turnover, 'min_trade_value': self.min_trade_value,
+                'cost_model': type(self.cost_model).__name__, 'cost_params': vars(self.cost_model),
+                'volume': self.adv is not None}
+
+    def save_state(self, path=CHECKPOINT_PATH):
+        """Write everything needed to continue the run after its last processed date."""
+        n = self.position
+        meta = {'config': self._config(), 'assets': [str(a) for a in self.assets], 'position': n,
+                'cash': self.cash, 'solves': self.session.solves}
+        arrays = {name: getattr(self, name)[:n] for name in RESULT_ARRAYS}
+        arrays.update({f"cov_{k}": v for k, v in self.cov_engine.get_state().items()})
+        arrays.update({f"window_{k}": v for k, v in self.window.get_state().items()})
+        arrays.update({f"monitor_{k}": v for k, v in self.monitor.get_state().items()})
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), dates=self.dates[:n].values,
+                 last_prices=self.trade_prices[n - 1] if n else np.zeros(0), holdings=self.holdings, **arrays)
+        os.replace(tmp_path, path)
+
+    def load_state(self, path=CHECKPOINT_PATH):
+        """Continue from a checkpoint; returns False (and starts over) if it does not fit this run."""
+        with np.load(path) as state:
+            meta = json.loads(state['meta'].item())
+            n = meta['position']
+            if meta['config'] != json.loads(json.dumps(self._config())):
+                self._log("[WARN] Checkpoint was written with different settings; running from the start")
+                return False
+            if meta['assets'] != [str(a) for a in self.assets]:
+                self._log("[WARN] Checkpoint asset list differs; running from the start")
+                return False
+            if n == 0 or n > len(self.dates) or not self.dates[:n].equals(pd.DatetimeIndex(state['dates'])):
+                self._log("[WARN] Checkpoint dates do not match the price history; running from the start")
+                return False
+            # Adjusted closes are rescaled after dividends and splits, which invalidates the saved run
+            if not np.allclose(state['last_prices'], self.trade_prices[n - 1], rtol=ADJUSTMENT_TOLERANCE, equal_nan=True):
+                self._log("[WARN] Price history was re-adjusted since the checkpoint; running from the start")
+                return False
+            if any(f"cov_{k}" not in state.files for k in self.cov_engine.get_state()):
+                self._log("[WARN] Checkpoint predates the current covariance state; running from the start")
+                return False
+
+            for name in RESULT_ARRAYS:
+                getattr(self, name)[:n] = state[name]
+            self.holdings = state['holdings'].astype('int64')
+            self.cash = meta['cash']
+            self.session.solves = meta['solves']
+            self.cov_engine.set_state({k[4:]: state[k] for k in state.files if k.startswith('cov_')})
+            self.window.set_state({k[7:]: state[k] for k in state.files if k.startswith('window_')})
+            self.monitor.set_state({k[8:]: state[k] for k in state.files if k.startswith('monitor_')})
+        if self.broker is not None:
+            self.broker.cash = self.cash
+            self.broker.positions = {tk: int(q) for tk, q in zip(self.assets, self.holdings) if q}
+        self.position = n
+        return True
+
+    # ------------ Export ------------
+
+    def save(self, path=RESULTS_DIR, sparse=False):
+        return save_results(self.dates, self.assets, self.values, self.weights, self.rebalanced, path, sparse,
+                            cash=self.cash_history, costs=self.trading_costs, turnover=self.turnover)
+
+    def allocations(self, assets=None):
+        """Date / PortfolioValue / per-asset percentage table, as written to CSV."""
+        weights = pd.DataFrame(self.weights, columns=self.assets)
+        if assets is not None:
+            weights = weights.reindex(columns=list(assets), fill_value=0.0)
+        table = pd.DataFrame(np.char.mod('%.2f%%', weights.to_numpy() * 100), columns=weights.columns)
+        table.insert(0, 'PortfolioValue', self.values)
+        table.insert(0, 'Date', self.dates.strftime('%Y-%m-%d'))
+        return table
+
+
+# Function to drop the allocations a schedule cannot take
+# Weights (... x rebalance x asset) given to a ticker with no price yet on its
+# rebalance row are set to 0, so that weight is held as cash.
+def priced_weights(prices, rebalance_rows, weights):
+    priced = np.nan_to_num(prices.ffill().to_numpy(dtype='float64'))[np.asarray(rebalance_rows)] > 0
+    return np.where(priced, np.asarray(weights, dtype='float64'), 0.0)
+
+
+# Function to compute the equity curves of a batch of weight schedules in one pass
+# ``weights`` is a strategy x rebalance x asset tensor of target weights applied on
+# the price rows in ``rebalance_rows``; weight left over, or given to a ticker that
+# has no price yet, is held as cash. Holdings
+# are fractional and costs are a flat ``cost_bps`` on traded notional, which keeps
+# every strategy and every segment between rebalances a broadcast over the shared
+# price matrix. Returns (values: strategies x dates, turnover: strategies x rebalances).
+def simulate_schedules(prices, rebalance_rows, weights, initial_capital=1.0, cost_bps=0.0):
+    P = np.nan_to_num(prices.ffill().to_numpy(dtype='float64'))     # 0 until a ticker is first priced
+    rows = np.asarray(rebalance_rows)
+    base = P[rows]
+    priced = base > 0
+    W = priced_weights(prices, rows, weights)
+    cash = 1.0 - W.sum(axis=2)                                          # strategies x rebalances
+
+    # Growth of each asset since the rebalance that opened each row's segment
+    segment = np.searchsorted(rows, np.arange(len(P)), side='right') - 1
+    live = segment >= 0
+    k = np.clip(segment, 0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative = np.where(priced[k], P / np.where(priced, base, 1.0)[k], 1.0)
+        closing = np.where(priced[:-1], P[rows[1:]] / np.where(priced, base, 1.0)[:-1], 1.0)
+    within = np.einsum('stn,tn->st', W[:, k, :], relative) + cash[:, k]
+
+    # Each segment's growth and the drifted weights that the next rebalance trades from
+    growth = np.einsum('skn,kn->sk', W[:, :-1, :], closing) + cash[:, :-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drifted = W[:, :-1, :] * closing / growth[:, :, None]
+    turnover = np.empty(W.shape[:2])
+    turnover[:, 0] = 0.5 * np.abs(W[:, 0, :]).sum(axis=1)
+    turnover[:, 1:] = 0.5 * np.abs(W[:, 1:, :] - drifted).sum(axis=2)
+    kept = 1.0 - cost_bps / 1e4 * 2 * turnover
+
+    # Capital right after each rebalance, then every row of its segment
+    capital = initial_capital * np.cumprod(np.concatenate([kept[:, :1], growth * kept[:, 1:]], axis=1), axis=1)
+    values = np.where(live, capital[:, k] * within, float(initial_capital))
+    return values, turnover
+
+
+# Function to run one backtest configuration end to end
+# The keyword arguments are BacktestEngine's parameters (momentum_lookback,
+# factor_weights, max_weight, min_group_weight, covariance_method, ...).
+def run_backtest(prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask, etf_tickers,
+                 initial_capital, **params):
+    return BacktestEngine(prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask, etf_tickers,
+                          initial_capital, **params).run()
@@ -1,7 +1,12 @@
+import os
 import pandas as pd
-import yfinance as yf
-import matplotlib.pyplot as plt
-from data_fetcher import fetch_fundamentals_yf, categorize_stocks, optimize_portfolio
+from data_fetcher import categorize_market_caps, fetch_yf_history, YF_VOLUME
+from fundamentals import load_pit_fundamentals
+from backtest_engine import BacktestEngine
+from costs import IBTieredCosts
+from sim_broker import SimBroker
+from opt_cache import OptimizerCache
+from analytics import write_report
 
 STOCK_TICKERS = [
     "AAPL",  # Apple
@@ -151,111 +156,83 @@ MARKET_ETFS = [
 
 # Combined Ticker List
 TICKERS = STOCK_TICKERS + SECTOR_ETFS + MARKET_ETFS
+ETF_TICKERS = SECTOR_ETFS + MARKET_ETFS
 
 # --- Configuration ---
 ASSETS = TICKERS
 START_DATE = "2019-01-01"
-END_DATE = "2025-04-27"
+END_DATE_OVERRIDE = None           # fixed end date (e.g. "2025-04-27") to pin a run; None runs up to today
+END_DATE = pd.Timestamp(END_DATE_OVERRIDE or pd.Timestamp.today()).normalize()
 INITIAL_CAPITAL = 1_000_000  # $1M
 MOMENTUM_LOOKBACK = 126      # days for momentum
+COVARIANCE_METHOD = "sample"       # sample, ledoit_wolf, ewma or factor
+COST_MODEL = IBTieredCosts()       # IB tiered commissions + half spread; costs.CostModel() is free
+EVENT_DRIVEN = False               # replay rebalances through trader.rebalance_portfolio on a SimBroker
+CHECKPOINT_PATH = "backtest_checkpoint.npz"
+RESUME = True                      # continue from the checkpoint and only process bars after it
+CACHE_OPTIMIZATIONS = True         # reuse solutions of identical problems from optimizer_cache/
+DRIFT_BAND = None                  # also rebalance when a weight drifts this far from target (e.g. 0.05)
+TURNOVER_PENALTY = 0.0             # trade-aware optimizer: score units charged per unit of weight traded
+MAX_TURNOVER = None                # trade-aware optimizer: cap on one-way turnover per rebalance (e.g. 0.3)
+MIN_TRADE_VALUE = 0.0              # skip orders worth less than this (closing a position always trades)
+REPORT_PATH = "backtest_report"    # summary.json, rolling.csv and performance.png
+RESULTS_PATH = "backtest_results"  # float32 .npy arrays, load with results_io.load_results
+SPARSE_WEIGHTS = True              # most weights are zero; store them as CSR
+EXPORT_CSV = False                 # also write the old backtest_allocations.csv
 
-# --- Fetch & prepare price history ---
-print("Downloading historical data via yfinance...")
-raw = yf.download(ASSETS, start=START_DATE, end=END_DATE, auto_adjust=True)
-if isinstance(raw.columns, pd.MultiIndex) and 'Close' in raw.columns.levels[0]:
-    historical_data = raw['Close']
-else:
-    historical_data = raw
-historical_data.index = pd.to_datetime(historical_data.index)
-historical_data = historical_data.dropna(axis=1, how='all')  # drop tickers with no data
-if historical_data.empty:
-    raise RuntimeError(f"No price data between {START_DATE} and {END_DATE}")
-print(f"Loaded price data: {historical_data.shape[0]} rows, {historical_data.shape[1]} assets.")
-
-# --- Fetch fundamentals ---
-print("Fetching fundamental data...")
-fundamentals = {t: f for t, f in ((tk, fetch_fundamentals_yf(tk)) for tk in ASSETS) if f is not None}
-small_caps, large_caps, _ = categorize_stocks(fundamentals)
-ETF_TICKERS = SECTOR_ETFS + MARKET_ETFS
 
-# --- Helper functions ---
-def get_current_weights(holdings, prices):
-    total_val = sum(holdings.get(t,0) * prices.get(t,0) for t in holdings)
-    if total_val <= 0:
-        return {}, 0.0
-    weights = {t: (holdings[t] * prices[t]) / total_val for t in holdings}
-    return weights, total_val
+# Function to load prices and point-in-time fundamentals for a backtest
+# Returns (prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask), all date x ticker.
+def load_backtest_inputs(assets=ASSETS, start=START_DATE, end=END_DATE):
+    # --- Fetch & prepare price history ---
+    print("Loading historical data (local price cache, topped up via yfinance)...")
+    historical_data = fetch_yf_history(assets, start, end)
+    historical_data = historical_data.dropna(axis=1, how='all')  # drop tickers with no data
+    if historical_data.empty:
+        raise RuntimeError(f"No price data between {start} and {end}")
+    print(f"Loaded price data: {historical_data.shape[0]} rows, {historical_data.shape[1]} assets.")
 
+    # --- Point-in-time fundamentals ---
+    # Market cap / PE as they stood on each date, so rebalances never see future data
+    print("Loading point-in-time fundamental data...")
+    pit = load_pit_fundamentals(list(historical_data.columns), start)
+    market_caps, pe_ratios = pit.align(historical_data)
+    small_cap_mask, large_cap_mask, _ = categorize_market_caps(market_caps)
+    return historical_data, market_caps, pe_ratios, small_cap_mask, large_cap_mask
 
-def check_constraints(weights, small_caps, large_caps, etfs):
-    if any(w > 0.20 for w in weights.values()):
-        return True
-    if small_caps and sum(weights.get(t, 0) for t in small_caps) < 0.10:
-        return True
-    if large_caps and sum(weights.get(t, 0) for t in large_caps) < 0.10:
-        return True
-    if etfs and sum(weights.get(t, 0) for t in etfs) < 0.10:
-        return True
-    return False
 
+def main():
+    historical_data, market_caps, pe_ratios, small_cap_mask, large_cap_mask = load_backtest_inputs()
+    # Daily volume for the cost model's market impact (cached with the closes)
+    volume = fetch_yf_history(list(historical_data.columns), START_DATE, END_DATE, what_to_show=YF_VOLUME)
 
-def rebalance(date, hist, fnds, prices, port_value):
-    window_start = date - pd.Timedelta(days=365)
-    past = hist.loc[window_start:date]
-    if len(past) < MOMENTUM_LOOKBACK + 1:
-        print(f"[WARN] Insufficient history ({len(past)}) at {date.date()}")
-        return None, None
-    valid_cols = past.dropna(axis=1, thresh=int(0.8 * len(past))).columns
-    past = past[valid_cols]
-    if past.empty:
-        print(f"[WARN] No valid price columns at {date.date()}")
-        return None, None
-    fund_flds = {t: fnds[t] for t in valid_cols if t in fnds}
-    if not fund_flds:
-        print(f"[WARN] No valid fundamentals at {date.date()}")
-        return None, None
-    try:
-        new_weights = optimize_portfolio(past, fund_flds)
-    except Exception as e:
-        print(f"[WARN] Optimization failed at {date.date()}: {e}")
-        return None, None
-    new_holdings = {}
-    for t, w in new_weights.items():
-        p = prices.get(t, 0)
-        if p > 0:
-            new_holdings[t] = int((port_value * w) / p)
-    return new_weights, new_holdings
+    # --- Backtest ---
+    print("Starting backtest...")
+    broker = SimBroker(INITIAL_CAPITAL, COST_MODEL) if EVENT_DRIVEN else None
+    engine = BacktestEngine(historical_data, market_caps, pe_ratios, small_cap_mask, large_cap_mask,
+                            ETF_TICKERS, INITIAL_CAPITAL, momentum_lookback=MOMENTUM_LOOKBACK,
+                            covariance_method=COVARIANCE_METHOD, cost_model=COST_MODEL, volume=volume, broker=broker,
+                            drift_band=DRIFT_BAND, turnover_penalty=TURNOVER_PENALTY, max_turnover=MAX_TURNOVER,
+                            min_trade_value=MIN_TRADE_VALUE,
+                            opt_cache=OptimizerCache() if CACHE_OPTIMIZATIONS else None)
+    if RESUME and os.path.exists(CHECKPOINT_PATH) and engine.load_state(CHECKPOINT_PATH):
+        last = engine.dates[engine.position - 1].date()
+        print(f"[INFO] Resuming after {last}: {len(engine.dates) - engine.position} new bars")
+    engine.run()
+    engine.save_state(CHECKPOINT_PATH)
 
-# --- Initialize portfolio ---
-first_date = historical_data.index[0]
-first_prices = historical_data.loc[first_date].to_dict()
-init_hist = historical_data.iloc[:252]
-init_weights = optimize_portfolio(init_hist, fundamentals)
-holdings = {t: int((INITIAL_CAPITAL * w) / first_prices[t]) for t, w in init_weights.items() if first_prices.get(t,0) > 0}
-weights, port_value = get_current_weights(holdings, first_prices)
+    # --- Output & report ---
+    engine.save(RESULTS_PATH, sparse=SPARSE_WEIGHTS)
+    if EXPORT_CSV:
+        engine.allocations(ASSETS).to_csv("backtest_allocations.csv", index=False)
+    print(f"Backtest complete; results saved to {RESULTS_PATH} ({engine.session.solves} optimizations).")
+    if engine.opt_cache is not None:
+        print(f"[INFO] Optimizer cache: {engine.opt_cache.hits} hits, {engine.opt_cache.misses} misses")
+    print(f"[INFO] Trading costs ${engine.trading_costs.sum():,.2f}, ending cash ${engine.cash:,.2f}")
+    summary = write_report(engine.dates, engine.values, engine.turnover, REPORT_PATH)
+    print(f"[INFO] CAGR {summary['cagr']:.2%}, Sharpe {summary['sharpe']:.2f}, "
+          f"max drawdown {summary['max_drawdown']:.2%} ({summary['drawdown_days']} days); report in {REPORT_PATH}")
 
-print("Starting backtest...")
-records = []
-# --- Backtest Loop ---
-for date, row in historical_data.iterrows():
-    prices = row.to_dict()
-    weights, port_value = get_current_weights(holdings, prices)
-    if check_constraints(weights, small_caps, large_caps, ETF_TICKERS):
-        print(f"[REBALANCE] at {date.date()}")
-        w_new, h_new = rebalance(date, historical_data, fundamentals, prices, port_value)
-        if h_new:
-            weights, holdings = w_new, h_new
-    rec = {"Date": date.strftime("%Y-%m-%d"), "PortfolioValue": port_value}
-    rec.update({t: f"{weights.get(t,0) * 100:.2f}%" for t in ASSETS})
-    records.append(rec)
 
-# --- Output & plot ---
-df = pd.DataFrame(records)
-df.to_csv("backtest_allocations.csv", index=False)
-print("Backtest complete; allocations saved.")
-plt.figure(figsize=(10,5))
-plt.plot(df["Date"], df["PortfolioValue"], marker='o', markersize=2)
-plt.xticks(rotation=45)
-plt.title("Portfolio Value Over Time")
-plt.tight_layout()
-plt.show()
+if __name__ == "__main__":
+    main()
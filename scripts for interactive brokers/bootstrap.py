@@ -0,0 +1,159 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analytics import summarize
+from backtest_engine import priced_weights
+from schedules import COST_BPS
+from sweep import SharedFrames
+
+BOOTSTRAP_RESULTS = "bootstrap_summary.csv"
+N_PATHS = 5000
+BLOCK_LENGTH = 21           # about a month of trading days per block
+CHUNK_SIZE = 25             # paths per task; memory is ~2 x CHUNK_SIZE x T x N float64
+SEED = 0
+MAX_WORKERS = os.cpu_count() or 1
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+# Function to draw circular moving-block bootstrap row indices
+# Each path is ``n`` rows made of blocks of ``block_length`` consecutive rows starting at random rows.
+def block_indices(rng, n_paths, n, block_length=BLOCK_LENGTH):
+    n_blocks = -(-n // block_length)
+    starts = rng.integers(0, n, size=(n_paths, n_blocks))
+    rows = (starts[:, :, None] + np.arange(block_length)) % n
+    return rows.reshape(n_paths, -1)[:, :n]
+
+
+# Function to run a batch of asset return paths through one weight schedule
+# ``returns`` is (paths, T-1, N), ``weights`` (K, N) set on rows ``rebalance_rows``
+# with the first at row 0, already passed through priced_weights. Returns
+# (values (paths, T), turnover (paths, K)).
+def simulate_paths(returns, rebalance_rows, weights, initial_capital=1.0, cost_bps=0.0):
+    n_paths, n_returns, _ = returns.shape
+    rows = np.asarray(rebalance_rows)
+    W = np.asarray(weights, dtype='float64')
+    cash = 1.0 - W.sum(axis=1)
+    growth_index = np.ones((n_paths, n_returns + 1, W.shape[1]))
+    np.cumprod(1.0 + returns, axis=1, out=growth_index[:, 1:])
+
+    # Value of one dollar invested at each rebalance, along its segment
+    ends = np.r_[rows[1:], n_returns + 1]
+    within = np.empty((n_paths, n_returns + 1))
+    growth = np.empty((n_paths, len(rows) - 1))
+    turnover = np.empty((n_paths, len(rows)))
+    turnover[:, 0] = 0.5 * np.abs(W[0]).sum()
+    for j, (start, end) in enumerate(zip(rows, ends)):
+        scaled = W[j] / growth_index[:, start]
+        within[:, start:end] = np.einsum('ptn,pn->pt', growth_index[:, start:end], scaled) + cash[j]
+        if end <= n_returns:
+            # Weights drifted to the next rebalance, which trades back to W[j + 1]
+            held = growth_index[:, end] * scaled
+            growth[:, j] = held.sum(axis=1) + cash[j]
+            turnover[:, j + 1] = 0.5 * np.abs(W[j + 1] - held / growth[:, j, None]).sum(axis=1)
+
+    kept = 1.0 - cost_bps / 1e4 * 2 * turnover
+    capital = initial_capital * np.cumprod(np.concatenate([kept[:, :1], growth * kept[:, 1:]], axis=1), axis=1)
+    segment = np.searchsorted(rows, np.arange(n_returns + 1), side='right') - 1
+    return capital[:, segment] * within, turnover
+
+
+# ------------ Workers ------------
+
+_worker = {}
+
+
+def _attach(spec, rebalance_rows, weights, initial_capital, cost_bps, block_length):
+    from multiprocessing import shared_memory
+
+    block_name, shape, dtype = spec['returns']
+    block = shared_memory.SharedMemory(name=block_name)
+    _worker.update(block=block, returns=np.ndarray(shape, np.dtype(dtype), buffer=block.buf),
+                   rows=rebalance_rows, weights=weights, initial_capital=initial_capital,
+                   cost_bps=cost_bps, block_length=block_length)
+
+
+def _run_chunk(seed, n_paths):
+    w = _worker
+    rng = np.random.default_rng(seed)
+    returns = w['returns']
+    paths = returns[block_indices(rng, n_paths, len(returns), w['block_length'])]
+    values, turnover = simulate_paths(paths, w['rows'], w['weights'], w['initial_capital'], w['cost_bps'])
+    daily = np.zeros(values.shape)
+    daily[:, w['rows']] = turnover
+    return summarize(values, daily)
+
+
+# ------------ Bootstrap ------------
+
+def asset_returns(prices):
+    """Daily asset returns from forward-filled prices; unpriced days return 0."""
+    values = prices.ffill().to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = values[1:] / values[:-1] - 1
+    return np.where(np.isfinite(returns), returns, 0.0)
+
+
+def distribution(metrics, observed=None):
+    """Metric x statistic table of the bootstrapped metric distributions."""
+    table = {}
+    for name, samples in metrics.items():
+        samples = np.asarray(samples, dtype='float64')
+        row = {'observed': np.nan if observed is None else np.asarray(observed[name]).item(),
+               'mean': np.nanmean(samples), 'std': np.nanstd(samples, ddof=1)}
+        row.update({f'p{q:02d}': v for q, v in zip(PERCENTILES, np.nanpercentile(samples, PERCENTILES))})
+        table[name] = row
+    return pd.DataFrame.from_dict(table, orient='index')
+
+
+# Function to bootstrap a backtest's weight schedule over resampled asset returns
+# The schedule is the post-trade weights on the rebalance rows of a run. Paths
+# resample the returns from the first rebalance on, in blocks so that
+# autocorrelation and cross-asset co-movement within a block are kept.
+# Chunks of paths run on a process pool against returns held in shared memory;
+# each chunk has its own seed from ``seed``, so results do not depend on the
+# number of workers. Returns one row of summary metrics per path.
+def bootstrap(prices, weights, rebalanced, initial_capital, n_paths=N_PATHS, block_length=BLOCK_LENGTH,
+              cost_bps=COST_BPS, chunk_size=CHUNK_SIZE, seed=SEED, max_workers=MAX_WORKERS):
+    rows = np.flatnonzero(rebalanced)
+    if len(rows) == 0:
+        raise ValueError("The run has no rebalances to bootstrap")
+    returns = asset_returns(prices.iloc[rows[0]:])
+    # As in simulate_schedules, weight on a ticker without a price at its rebalance is held as cash
+    schedule = priced_weights(prices, rows, np.asarray(weights, dtype='float64')[rows])
+    rows = rows - rows[0]
+
+    sizes = [min(chunk_size, n_paths - first) for first in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    shared = SharedFrames({'returns': pd.DataFrame(returns)})
+    print(f"[INFO] Bootstrapping {n_paths} paths of {len(returns)} days in {len(sizes)} chunks "
+          f"on {max_workers} workers...")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(shared.spec, rows, schedule, initial_capital, cost_bps,
+                                           block_length)) as pool:
+            chunks = list(pool.map(_run_chunk, seeds, sizes))
+    finally:
+        shared.close()
+
+    return pd.DataFrame({name: np.concatenate([np.atleast_1d(c[name]) for c in chunks]) for name in chunks[0]})
+
+
+def main():
+    from backtester import load_backtest_inputs, INITIAL_CAPITAL, RESULTS_PATH
+    from results_io import load_results
+
+    run = load_results(RESULTS_PATH)
+    prices = load_backtest_inputs()[0].reindex(index=run.dates, columns=run.assets)
+    paths = bootstrap(prices, run.dense_weights, run.rebalanced, INITIAL_CAPITAL)
+
+    start = np.flatnonzero(run.rebalanced)[0]
+    turnover = run.series['turnover'][start:] if 'turnover' in run.series else None
+    table = distribution(paths, summarize(np.asarray(run.values[start:]), turnover))
+    table.to_csv(BOOTSTRAP_RESULTS, index_label='metric')
+    print(table.to_string())
+    print(f"Bootstrap of {len(paths)} paths saved to {BOOTSTRAP_RESULTS}.")
+
+
+if __name__ == "__main__":
+    main()
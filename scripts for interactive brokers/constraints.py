@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from data_fetcher import MAX_ASSET_WEIGHT, MIN_GROUP_WEIGHT
+
+
+class ConstraintSet:
+    """Portfolio rules compiled once into masks over a fixed asset index.
+
+    Rules: no single weight above ``max_weight``, and every non-empty group at
+    ``min_group_weight`` or more. Group membership is a boolean mask, either one
+    row per date (T x N, e.g. market-cap buckets that change over time) or a
+    single row (N,) that holds on every date (e.g. the ETF list). Group weights
+    for a day are one (G x N) @ (N,) product; a whole T x N weight history is
+    checked with a single einsum.
+    """
+
+    def __init__(self, assets, groups, max_weight=MAX_ASSET_WEIGHT, min_group_weight=MIN_GROUP_WEIGHT):
+        self.assets = pd.Index(assets)
+        self.names = list(groups)
+        self.max_weight = max_weight
+        self.min_group_weight = min_group_weight
+
+        masks = [self._mask(groups[name]) for name in self.names]
+        n_days = max((m.shape[0] for m in masks if m.ndim == 2), default=1)
+        masks = [np.broadcast_to(m, (n_days, len(self.assets))) for m in masks]
+        self.members = np.stack(masks, axis=1).astype('float64')     # T x G x N
+        self.active = self.members.any(axis=2)                         # T x G, empty groups are not enforced
+
+    def _mask(self, mask):
+        if isinstance(mask, pd.DataFrame):
+            mask = mask.reindex(columns=self.assets, fill_value=False)
+        elif isinstance(mask, pd.Series):
+            mask = mask.reindex(self.assets, fill_value=False)
+        return np.asarray(mask, dtype=bool)
+
+    @classmethod
+    def for_universe(cls, assets, small_cap_mask, large_cap_mask, etf_tickers, **kwargs):
+        """The backtest rules: small caps, large caps and ETFs each at least the group minimum."""
+        assets = pd.Index(assets)
+        return cls(assets, {'small_caps': small_cap_mask, 'large_caps': large_cap_mask,
+                            'etfs': assets.isin(list(etf_tickers))}, **kwargs)
+
+    def _day(self, i):
+        return 0 if self.members.shape[0] == 1 else i
+
+    # ------------ One weight vector ------------
+
+    def group_weights(self, weights, i=0):
+        return self.members[self._day(i)] @ weights
+
+    def violations(self, weights, i=0):
+        """``{rule: broken}`` for one weight vector on day ``i``."""
+        d = self._day(i)
+        short = self.active[d] & (self.members[d] @ weights < self.min_group_weight)
+        return {'max_weight': bool((weights > self.max_weight).any()), **dict(zip(self.names, short.tolist()))}
+
+    def breached(self, weights, i=0):
+        if (weights > self.max_weight).any():
+            return True
+        d = self._day(i)
+        return bool((self.active[d] & (self.members[d] @ weights < self.min_group_weight)).any())
+
+    # ------------ Whole history ------------
+
+    def evaluate(self, weight_history):
+        """Rule-by-rule breaches for a T x N weight history, as a T x (1 + G) bool frame."""
+        weights = np.asarray(weight_history, dtype='float64')
+        members = np.broadcast_to(self.members, (len(weights),) + self.members.shape[1:])
+        active = np.broadcast_to(self.active, (len(weights), len(self.names)))
+        short = active & (np.einsum('tgn,tn->tg', members, weights) < self.min_group_weight)
+        table = pd.DataFrame(short, columns=self.names)
+        table.insert(0, 'max_weight', (weights > self.max_weight).any(axis=1))
+        if isinstance(weight_history, pd.DataFrame):
+            table.index = weight_history.index
+        return table
+
+    def breached_history(self, weight_history):
+        return self.evaluate(weight_history).any(axis=1).to_numpy()
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# IBKR Pro tiered pricing, lowest-volume tier (<= 300,000 shares a month).
+# Exchange, clearing and regulatory fees are not modelled.
+IB_TIERED_PER_SHARE = 0.0035
+IB_TIERED_MIN_PER_ORDER = 0.35
+IB_TIERED_MAX_PCT = 0.01          # commission capped at 1% of trade value
+SPREAD_BPS = 5.0                  # quoted bid/ask spread; each trade pays half of it
+IMPACT_COEFFICIENT = 0.1          # square-root impact: k * sigma * sqrt(shares / ADV) of the notional
+IMPACT_VOLATILITY = 0.02          # daily volatility used when none is given
+ADV_WINDOW = 20                   # days in the average daily volume
+
+
+class CostModel:
+    """Trading costs of one rebalance, vectorized over the trade vector.
+
+    ``costs(trades, prices, adv=None, volatility=None)`` takes signed share
+    counts and execution prices aligned to the same asset index and returns
+    the cost per asset in dollars (always >= 0). This base model is free.
+    """
+
+    def costs(self, trades, prices, adv=None, volatility=None):
+        return np.zeros(len(trades))
+
+    def total(self, trades, prices, adv=None, volatility=None):
+        return float(self.costs(trades, prices, adv, volatility).sum())
+
+
+class IBTieredCosts(CostModel):
+    """IB tiered commission per order, half the bid/ask spread and square-root market impact.
+
+    Impact is only charged where an average daily volume is known.
+    """
+
+    def __init__(self, per_share=IB_TIERED_PER_SHARE, min_per_order=IB_TIERED_MIN_PER_ORDER,
+                 max_pct=IB_TIERED_MAX_PCT, spread_bps=SPREAD_BPS, impact_coefficient=IMPACT_COEFFICIENT,
+                 impact_volatility=IMPACT_VOLATILITY):
+        self.per_share = per_share
+        self.min_per_order = min_per_order
+        self.max_pct = max_pct
+        self.spread_bps = spread_bps
+        self.impact_coefficient = impact_coefficient
+        self.impact_volatility = impact_volatility
+
+    def commissions(self, trades, prices):
+        shares = np.abs(trades)
+        notional = shares * np.nan_to_num(prices)
+        # The 1% cap wins over the order minimum on very small orders
+        commission = np.minimum(np.maximum(shares * self.per_share, self.min_per_order), self.max_pct * notional)
+        return np.where(shares > 0, commission, 0.0)
+
+    def spread(self, trades, prices):
+        return np.abs(trades) * np.nan_to_num(prices) * self.spread_bps / 2 / 1e4
+
+    def impact(self, trades, prices, adv=None, volatility=None):
+        if adv is None:
+            return np.zeros(len(trades))
+        shares = np.abs(trades)
+        adv = np.nan_to_num(np.asarray(adv, dtype='float64'))
+        sigma = self.impact_volatility if volatility is None else np.nan_to_num(volatility)
+        participation = np.divide(shares, adv, out=np.zeros(len(shares)), where=adv > 0)
+        return self.impact_coefficient * sigma * np.sqrt(participation) * shares * np.nan_to_num(prices)
+
+    def costs(self, trades, prices, adv=None, volatility=None):
+        trades = np.asarray(trades, dtype='float64')
+        prices = np.asarray(prices, dtype='float64')
+        return self.commissions(trades, prices) + self.spread(trades, prices) + self.impact(trades, prices, adv, volatility)
+
+
+# Function to turn a date x ticker volume frame into the ADV known before each day's open
+def average_daily_volume(volume, window=ADV_WINDOW):
+    return volume.rolling(window, min_periods=1).mean().shift(1)
@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+
+FREQUENCY = 252          # trading days per year, as in pypfopt.risk_models
+EWMA_SPAN = 180          # pypfopt.risk_models.exp_cov default
+REFRESH_EVERY = 1000     # rebuild the running sums after this many row updates to bound drift
+METHODS = ('sample', 'ledoit_wolf', 'ewma', 'factor')
+STATE = ('start', 'end', 'count', 's1', 's2', 'sxy', 'q', 'p', 'pairs', 'pair_sums',
+         'ewma_sxy', 'ewma_pairs', 'ewma_pair_sums', 'updates')
+
+
+class CovarianceEngine:
+    """Annualised covariance estimates over a rolling window of daily returns.
+
+    The engine keeps running sums over the rows in the window, so moving the
+    window by one day costs O(N^2) instead of re-reading T x N returns:
+
+    - sample:      unbiased sample covariance over the rows where both returns
+                   exist, as risk_models.sample_cov (pandas' pairwise cov)
+    - ledoit_wolf: Ledoit-Wolf shrinkage towards a scaled identity (the same
+                   estimate as CovarianceShrinkage(...).ledoit_wolf())
+    - ewma:        exponentially weighted covariance over the window, as
+                   risk_models.exp_cov, from sums decayed towards the window end
+    - factor:      single-index model on the equal-weighted market return,
+                   built on the 'sample' estimate
+
+    Missing returns are skipped pair by pair as in pypfopt, except for
+    ledoit_wolf, where they count as zero as CovarianceShrinkage does.
+    """
+
+    def __init__(self, returns, columns=None, frequency=FREQUENCY, span=EWMA_SPAN, refresh_every=REFRESH_EVERY):
+        if isinstance(returns, pd.DataFrame):
+            columns = returns.columns if columns is None else columns
+            returns = returns.to_numpy(dtype='float64')
+        returns = np.asarray(returns, dtype='float64')
+        self.observed = np.isfinite(returns).astype('float64')
+        self.returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+        self.columns = pd.Index(columns if columns is not None else range(self.returns.shape[1]))
+        self.position = {c: i for i, c in enumerate(self.columns)}
+        self.frequency = frequency
+        self.decay = 1.0 - 2.0 / (span + 1.0)
+        self.refresh_every = refresh_every
+        self._reset(0)
+
+    @classmethod
+    def from_prices(cls, prices, **kwargs):
+        # Row t holds the return from price row t-1 to t (row 0 is all missing)
+        returns = prices.pct_change(fill_method=None)
+        return cls(returns, columns=prices.columns, **kwargs)
+
+    # ------------ Running sums ------------
+
+    def _reset(self, position):
+        n = self.returns.shape[1]
+        self.start = self.end = position
+        self.count = 0
+        self.s1 = np.zeros(n)                  # sum x_i
+        self.s2 = np.zeros(n)                  # sum x_i^2
+        self.sxy = np.zeros((n, n))            # sum x_i x_j
+        self.q = np.zeros((n, n))              # sum x_i^2 x_j
+        self.p = np.zeros((n, n))              # sum x_i^2 x_j^2
+        self.pairs = np.zeros((n, n))          # rows where both x_i and x_j exist
+        self.pair_sums = np.zeros((n, n))      # sum x_i over the rows where x_j exists
+        self.ewma_sxy = np.zeros((n, n))       # the same three sums, row t weighted decay^(end - 1 - t)
+        self.ewma_pairs = np.zeros((n, n))
+        self.ewma_pair_sums = np.zeros((n, n))
+        self.updates = 0
+
+    def _apply(self, rows, sign, end):
+        if len(rows) == 0:
+            return
+        x = self.returns[rows]
+        x2 = x * x
+        seen = self.observed[rows]
+        weights = (self.decay ** (end - 1 - rows))[:, None]
+        self.ewma_sxy += sign * ((x * weights).T @ x)
+        self.ewma_pairs += sign * ((seen * weights).T @ seen)
+        self.ewma_pair_sums += sign * ((x * weights).T @ seen)
+        self.count += sign * len(rows)
+        self.s1 += sign * x.sum(axis=0)
+        self.s2 += sign * x2.sum(axis=0)
+        self.sxy += sign * (x.T @ x)
+        self.q += sign * (x2.T @ x)
+        self.p += sign * (x2.T @ x2)
+        self.pairs += sign * (seen.T @ seen)
+        self.pair_sums += sign * (x.T @ seen)
+        self.updates += len(rows)
+
+    def get_state(self):
+        """The window position and running sums, for checkpointing."""
+        return {name: getattr(self, name) for name in STATE}
+
+    def set_state(self, state):
+        for name in STATE:
+            value = np.asarray(state[name])
+            setattr(self, name, value.copy() if value.ndim else value.item())
+        return self
+
+    def roll(self, start, end):
+        """Move the window to return rows [start, end)."""
+        rebuild = (start < self.start or end < self.end or start >= self.end
+                   or self.updates + (end - self.end) + (start - self.start) > self.refresh_every)
+        if rebuild:
+            self._reset(start)
+            self._apply(np.arange(start, end), +1, end)
+        else:
+            # Age the decayed sums to the new window end before adding and dropping rows
+            age = self.decay ** (end - self.end)
+            self.ewma_sxy *= age
+            self.ewma_pairs *= age
+            self.ewma_pair_sums *= age
+            self._apply(np.arange(self.end, end), +1, end)
+            self._apply(np.arange(self.start, start), -1, end)
+        self.start, self.end = start, end
+        return self
+
+    # ------------ Estimates ------------
+
+    def _index(self, columns):
+        if columns is None:
+            return np.arange(len(self.columns)), self.columns
+        columns = pd.Index(columns)
+        return np.array([self.position[c] for c in columns]), columns
+
+    def _sample(self, idx):
+        # Each pair uses its own rows and means; pairs seen together fewer than twice get 0
+        n = self.pairs[np.ix_(idx, idx)]
+        sums = self.pair_sums[np.ix_(idx, idx)]
+        scatter = self.sxy[np.ix_(idx, idx)] - np.divide(sums * sums.T, n, out=np.zeros_like(n), where=n > 0)
+        return np.divide(scatter, n - 1, out=np.zeros_like(n), where=n > 1)
+
+    def _ewma(self, idx):
+        # Each asset is centred on its own mean over the window, as in risk_models._pair_exp_cov
+        counts = np.diag(self.pairs)[idx]
+        mean = np.divide(np.diag(self.pair_sums)[idx], counts, out=np.zeros(len(idx)), where=counts > 0)
+        weight = self.ewma_pairs[np.ix_(idx, idx)]
+        sums = self.ewma_pair_sums[np.ix_(idx, idx)]
+        scatter = (self.ewma_sxy[np.ix_(idx, idx)] - sums * mean[None, :] - sums.T * mean[:, None]
+                   + np.outer(mean, mean) * weight)
+        return np.divide(scatter, weight, out=np.zeros_like(weight), where=weight > 0)
+
+    @staticmethod
+    def _psd(cov):
+        # Pairwise estimates need not be PSD; clip negative eigenvalues as risk_models.fix_nonpositive_semidefinite
+        values, vectors = np.linalg.eigh(cov)
+        if values.min() < 0:
+            cov = (vectors * np.clip(values, 0.0, None)) @ vectors.T
+        return cov
+
+    def _ledoit_wolf(self, idx):
+        # sklearn.covariance.ledoit_wolf written in terms of the running sums
+        n, k = self.count, len(idx)
+        m = self.s1[idx] / n
+        s1, s2 = self.s1[idx], self.s2[idx]
+        sxy = self.sxy[np.ix_(idx, idx)]
+        q = self.q[np.ix_(idx, idx)]
+
+        scatter = sxy - n * np.outer(m, m)
+        emp_cov = scatter / n
+        mu = np.trace(emp_cov) / k
+
+        # sum_t (x_ti - m_i)^2 (x_tj - m_j)^2, expanded into the stored moments
+        mi, mj = m[:, None], m[None, :]
+        fourth = (self.p[np.ix_(idx, idx)]
+                  - 2 * mj * q - 2 * mi * q.T
+                  + mj ** 2 * s2[:, None] + mi ** 2 * s2[None, :]
+                  + 4 * mi * mj * sxy
+                  - 2 * mi * mj ** 2 * s1[:, None] - 2 * mi ** 2 * mj * s1[None, :]
+                  + n * mi ** 2 * mj ** 2)
+
+        delta_ = (scatter ** 2).sum() / n ** 2
+        beta = (fourth.sum() / n - delta_) / (k * n)
+        delta = (delta_ - 2 * mu * np.trace(emp_cov) + k * mu ** 2) / k
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+
+        shrunk = (1 - shrinkage) * emp_cov
+        shrunk[np.diag_indices(k)] += shrinkage * mu
+        return shrunk
+
+    def _factor(self, idx):
+        sample = self._sample(idx)
+        market_var = sample.mean()
+        if market_var <= 0:
+            return np.diag(np.diag(sample))
+        beta = sample.mean(axis=1) / market_var
+        residual = np.clip(np.diag(sample) - beta ** 2 * market_var, 0.0, None)
+        return market_var * np.outer(beta, beta) + np.diag(residual)
+
+    def covariance(self, method='sample', columns=None):
+        """Annualised covariance for ``columns`` (default: all) as a DataFrame."""
+        if method not in METHODS:
+            raise ValueError(f"Unknown covariance method: {method}")
+        if self.count < 2:
+            raise ValueError("Covariance needs at least two return rows in the window")
+        idx, labels = self._index(columns)
+        if method == 'sample':
+            cov = self._psd(self._sample(idx))
+        elif method == 'ledoit_wolf':
+            cov = self._ledoit_wolf(idx)
+        elif method == 'ewma':
+            cov = self._psd(self._ewma(idx))
+        else:
+            cov = self._factor(idx)
+        return pd.DataFrame(cov * self.frequency, index=labels, columns=labels)
@@ -1,44 +1,235 @@
+import logging
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-import time
-import shinybroker as sb
+import scipy.sparse as sp
 import yfinance as yf
 from pypfopt.efficient_frontier import EfficientFrontier
 from pypfopt import EfficientFrontier, risk_models, expected_returns, objective_functions
+from market_data import fetch_closes, fetch_snapshot_prices
+from price_store import PriceStore
+from covariance import CovarianceEngine
+
+HIST_BAR_SIZE = '1 day'
+HIST_WHAT_TO_SHOW = 'ADJUSTED_LAST'
+HIST_LOOKBACK_DAYS = 365
+YF_BAR_SIZE = '1 day'
+YF_WHAT_TO_SHOW = 'YF_ADJ_CLOSE'
+YF_VOLUME = 'YF_VOLUME'
+YF_FIELDS = {YF_WHAT_TO_SHOW: 'Close', YF_VOLUME: 'Volume'}   # price store key -> yfinance column
+
+ETF_LIST = ["SPY", "QQQ", "IVV", "VOO", "VTI", "IWM", "DIA", "XLF", "XLK", "XLY", "XLC", "XLE", "XLV", "XLI", "XLB", "XLRE", "XLU"]
+SMALL_CAP_MAX = 2e9
+LARGE_CAP_MIN = 10e9
+
+# Weight of each factor in the combined expected-return score used by optimize_portfolio
+FACTOR_WEIGHTS = {'momentum': 0.8, 'size': 0.0, 'value': 0.2}
+MOMENTUM_WINDOW = 126          # 6-month price change
+NEUTRAL_VALUE_SCORE = 0.5      # a missing PE is neutral, not penalized
+MAX_ASSET_WEIGHT = 0.20        # no individual asset above 20%
+MIN_GROUP_WEIGHT = 0.10        # small caps, large caps and ETFs each at least 10%
+
+logger = logging.getLogger(__name__)
+
+
+# Function to align per-ticker close series into one matrix in a single pass
+def assemble_closes(closes, join='inner'):
+    """Build a timestamp x ticker close matrix from ``{ticker: Series}``.
+
+    ``join`` is 'inner' (keep only dates every ticker has), 'outer' (union of
+    dates, gaps left as NaN) or 'ffill' (union of dates, gaps forward-filled and
+    any leading rows that are still incomplete dropped). Returns ``(df, dropped)``
+    where ``dropped`` maps each ticker to the number of removed rows it was
+    missing from.
+    """
+    if join not in ('inner', 'outer', 'ffill'):
+        raise ValueError(f"Unknown join policy: {join}")
+
+    df = pd.concat(list(closes.values()), axis=1, join='outer', sort=True)
+    df.index = pd.to_datetime(df.index)
+    df.index.name = 'timestamp'
+    if join == 'ffill':
+        df = df.ffill()
+
+    dropped = {}
+    if join != 'outer':
+        missing = df.isna()
+        incomplete = missing.any(axis=1)
+        if incomplete.any():
+            counts = missing[incomplete].sum()
+            dropped = {tk: int(n) for tk, n in counts[counts > 0].items()}
+            df = df[~incomplete]
+    return df, dropped
+
+
+def _with_datetime_index(series):
+    series = series.copy()
+    series.index = pd.to_datetime(series.index)
+    return series
 
 
-# Function to fetch close price for a given ticker using shinybroker
-def fetch_close_for_a_ticker(ticker):
-    df = sb.fetch_historical_data(
-        contract=sb.Contract({
-            'symbol': ticker,
-            'secType': "STK",
-            'exchange': "SMART",
-            'currency': "USD"
-        }),
-        barSizeSetting='1 day',
-        durationStr='1 Y',
-        whatToShow='ADJUSTED_LAST'
-    )['hst_dta'][['timestamp', 'close']]
-    df = df.rename(columns={'close': ticker})
+# Function to fetch historical data for multiple tickers
+# Requests go out concurrently over one IB connection; tickers that failed are
+# reported and listed in df.attrs['fetch_errors'] instead of aborting the run.
+# Bars already in the local price store are reused and only newer bars are requested;
+# if that request fails the cached bars are used as they are.
+def fetch_historical_data(tickers, join='inner', store=None):
+    store = store or PriceStore()
+    today = pd.Timestamp.today().normalize()
+    window_start = today - pd.Timedelta(days=HIST_LOOKBACK_DAYS)
+
+    durations, cached_bars = {}, {}
+    for tk in tickers:
+        cached = None
+        if store.covers(tk, HIST_BAR_SIZE, HIST_WHAT_TO_SHOW, window_start):
+            cached = store.load(tk, HIST_BAR_SIZE, HIST_WHAT_TO_SHOW)
+        if cached is not None and len(cached) > 0:
+            cached_bars[tk] = cached
+            days = (today - cached.index[-1].normalize()).days + 1
+            durations[tk] = f"{days} D" if days <= HIST_LOOKBACK_DAYS else '1 Y'
+        else:
+            durations[tk] = '1 Y'
+
+    closes, errors = fetch_closes(tickers, duration=durations)
+    stale = []
+    for tk, bars in list(closes.items()):
+        bars = _with_datetime_index(bars)
+        if durations[tk] == '1 Y':
+            closes[tk] = store.merge(tk, HIST_BAR_SIZE, HIST_WHAT_TO_SHOW, bars, window_start, today)
+            continue
+        combined = store.extend(tk, HIST_BAR_SIZE, HIST_WHAT_TO_SHOW, bars, today)
+        if combined is None:
+            stale.append(tk)
+            del closes[tk]
+        else:
+            closes[tk] = combined
+
+    if stale:
+        print(f"[INFO] Adjusted history changed for {len(stale)} cached tickers, re-downloading")
+        refetched, refetch_errors = fetch_closes(stale)
+        errors.update(refetch_errors)
+        for tk, bars in refetched.items():
+            bars = _with_datetime_index(bars)
+            closes[tk] = store.merge(tk, HIST_BAR_SIZE, HIST_WHAT_TO_SHOW, bars, window_start, today)
+
+    for tk in [tk for tk in errors if tk in cached_bars and tk not in closes]:
+        print(f"[WARN] Update failed for {tk} ({errors.pop(tk)}); using cached bars up to "
+              f"{cached_bars[tk].index[-1].date()}")
+        closes[tk] = cached_bars[tk]
+
+    for tk, message in errors.items():
+        print(f"⚠️ Historical data failed for {tk}: {message}")
+    if not closes:
+        raise RuntimeError("No historical data could be fetched for any ticker")
+
+    window = {tk: closes[tk].loc[window_start:] for tk in tickers if tk in closes}
+    df, dropped = assemble_closes(window, join=join)
+    for tk, n in sorted(dropped.items(), key=lambda item: -item[1]):
+        print(f"⚠️ {tk} is missing {n} of the dropped rows ({join} join)")
+
+    df.attrs['fetch_errors'] = errors
+    df.attrs['dropped_rows'] = dropped
     return df
 
 
-# Function to fetch historical data for multiple tickers
-def fetch_historical_data(tickers):
-    df = fetch_close_for_a_ticker(tickers[0])
-    for tk in tickers[1:]:
-        df = pd.merge(df, fetch_close_for_a_ticker(tk), on='timestamp')
-        time.sleep(0.1)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    return df.set_index('timestamp')
+def _yf_download(tickers, start, end):
+    """Daily bars from yfinance as ``{what_to_show: date x ticker frame}`` for every YF_FIELDS entry."""
+    raw = yf.download(tickers, start=start, end=end, auto_adjust=True, progress=False)
+    frames = {}
+    for what_to_show, column in YF_FIELDS.items():
+        if isinstance(raw.columns, pd.MultiIndex):
+            frame = raw[column] if column in raw.columns.levels[0] else pd.DataFrame(index=raw.index)
+        else:
+            frame = raw[[column]].set_axis([tickers[0]], axis=1) if column in raw else pd.DataFrame(index=raw.index)
+        frame.index = pd.to_datetime(frame.index)
+        frames[what_to_show] = frame
+    return frames
+
+
+def _column(frame, tk):
+    return frame[tk].dropna() if tk in frame else pd.Series(dtype='float64')
+
+
+# Function to fetch daily adjusted closes (or volume, with what_to_show=YF_VOLUME) from
+# yfinance through the local price store
+# Only tickers the store has never covered for [start, end) are downloaded in full;
+# the rest are topped up from their last cached bar. Every download keeps all of
+# YF_FIELDS, so the closes and volume of a ticker are fetched together.
+def fetch_yf_history(tickers, start, end, store=None, what_to_show=YF_WHAT_TO_SHOW):
+    store = store or PriceStore()
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    covered_to = min(end, pd.Timestamp.today().normalize())
+
+    series, full, topup = {}, [], {}
+    for tk in tickers:
+        cov_from, cov_to = store.coverage(tk, YF_BAR_SIZE, what_to_show)
+        cached = store.load(tk, YF_BAR_SIZE, what_to_show) if cov_from is not None else None
+        if cached is None or len(cached) == 0 or cov_from > start:
+            full.append(tk)
+        elif cov_to < covered_to:
+            topup[tk] = cached
+        else:
+            series[tk] = cached
+
+    if topup:
+        print(f"[INFO] Topping up {len(topup)} cached tickers from yfinance...")
+        since = min(cached.index[-1] for cached in topup.values())
+        fresh = _yf_download(list(topup), since, end)
+        for tk in topup:
+            combined = {}
+            for field, frame in fresh.items():
+                cached = store.load(tk, YF_BAR_SIZE, field)
+                if cached is None or len(cached) == 0:
+                    continue        # never downloaded; the next full download fills it
+                bars = _column(frame, tk)
+                if bars.empty:
+                    cov_from, _ = store.coverage(tk, YF_BAR_SIZE, field)
+                    store.save(tk, YF_BAR_SIZE, field, cached, cov_from, covered_to)
+                    combined[field] = cached
+                else:
+                    combined[field] = store.extend(tk, YF_BAR_SIZE, field, bars, covered_to)
+            if combined[what_to_show] is None:
+                full.append(tk)
+            else:
+                series[tk] = combined[what_to_show]
+
+    if full:
+        print(f"[INFO] Downloading full history for {len(full)} tickers from yfinance...")
+        fresh = _yf_download(full, start, end)
+        for tk in full:
+            for field, frame in fresh.items():
+                bars = _column(frame, tk)
+                if bars.empty:
+                    continue
+                merged = store.merge(tk, YF_BAR_SIZE, field, bars, start, covered_to)
+                if field == what_to_show:
+                    series[tk] = merged
+
+    columns = sorted(set(tickers))
+    if not series:
+        return pd.DataFrame(columns=columns, dtype='float64')
+    df = pd.concat(series, axis=1).reindex(columns=columns)
+    return df[(df.index >= start) & (df.index < end)]
 
 
 # Function to fetch the latest prices for multiple tickers
-def fetch_latest_prices(tickers):
+# Reuses already-fetched daily history when its last bar is recent enough and
+# falls back to one batch of reqMktData snapshots for everything else.
+def fetch_latest_prices(tickers, history=None, max_age_days=1):
     prices = {}
-    for tk in tickers:
-        df = fetch_close_for_a_ticker(tk)
-        prices[tk] = df[tk].iloc[-1]
+    if history is not None and len(history) > 0:
+        oldest_fresh = pd.Timestamp.today().normalize() - pd.offsets.BDay(max_age_days)
+        if history.index[-1].normalize() >= oldest_fresh:
+            last_row = history.iloc[-1]
+            prices = {tk: float(last_row[tk]) for tk in tickers
+                      if tk in last_row.index and last_row[tk] > 0}
+
+    missing = [tk for tk in tickers if tk not in prices]
+    if missing:
+        snapshot, errors = fetch_snapshot_prices(missing)
+        prices.update(snapshot)
+        for tk, message in errors.items():
+            print(f"⚠️ Latest price failed for {tk}: {message}")
     return prices
 
 
@@ -72,100 +263,182 @@ def categorize_stocks(fundamentals):
         market_cap = data.get('market_cap', 0)
         
         # Classify ETFs based on tickers or sector
-        if ticker in ["SPY", "QQQ", "IVV", "VOO", "VTI", "IWM", "DIA", "XLF", "XLK", "XLY", "XLC", "XLE", "XLV", "XLI", "XLB", "XLRE", "XLU"]:
+        if ticker in ETF_LIST:
             etfs.append(ticker)
         # Classify by market cap
-        elif market_cap < 2e9:  # Small Cap
+        elif market_cap < SMALL_CAP_MAX:  # Small Cap
             small_caps.append(ticker)
-            print('small_cap detected: ', ticker)
-        elif market_cap > 10e9:  # Large Cap
+            logger.debug("small_cap detected: %s", ticker)
+        elif market_cap > LARGE_CAP_MIN:  # Large Cap
             large_caps.append(ticker)
-            print('large_cap detected: ', ticker)
+            logger.debug("large_cap detected: %s", ticker)
 
     
     return small_caps, large_caps, etfs
 
-# Function to optimize the portfolio using momentum, size (market cap), and value (PE ratio)
-def optimize_portfolio(historical_data, fundamentals):
-    # 1. Momentum Factor: 6-month price change
-    momentum = historical_data.pct_change(126).iloc[-1].dropna()
-
-    # Scale momentum scores between 0 and 1
-    min_mom = momentum.min()
-    max_mom = momentum.max()
-    scaled_momentum = (momentum - min_mom) / (max_mom - min_mom)
-
 
-    # # 2. Size Factor: Market Cap (larger market cap = higher score)
-    market_caps = {ticker: fundamentals[ticker].get('market_cap', None) for ticker in fundamentals}
-    
-    # # Remove tickers with None as market cap
-    market_caps = {ticker: cap for ticker, cap in market_caps.items() if cap is not None}
-    # valid_tickers = [ticker for ticker in tickers if fundamentals.get(ticker)]
-
-    small_caps, large_caps, etfs = categorize_stocks(fundamentals)
-
-    # Check if there are any valid market cap values to compute scaling
-    if len(market_caps) > 0:
-        min_size = min(market_caps.values())
-        max_size = max(market_caps.values())
-        scaled_size = {ticker: (market_caps[ticker] - min_size) / (max_size - min_size) for ticker in market_caps}
-    else:
-        scaled_size = {}
+# Vectorized categorize_stocks over market caps (a Series for one date, or a
+# date x ticker DataFrame). Returns boolean masks shaped like the input.
+def categorize_market_caps(market_caps):
+    tickers = market_caps.columns if isinstance(market_caps, pd.DataFrame) else market_caps.index
+    is_etf = tickers.isin(ETF_LIST)
+    known = market_caps.notna()
+    etfs = known & is_etf
+    small_caps = (market_caps < SMALL_CAP_MAX) & ~is_etf
+    large_caps = (market_caps > LARGE_CAP_MIN) & ~is_etf
+    return small_caps, large_caps, etfs
 
-    # 3. Value Factor: PE ratio (lower PE = better value)
-    pe_ratios = {ticker: fundamentals[ticker].get('pe_ratio', None) for ticker in fundamentals}
-    
-    # Remove tickers with None as PE ratio
-    pe_ratios = {ticker: pe for ticker, pe in pe_ratios.items() if pe is not None}
-
-    # Check if there are any valid PE ratios to compute scaling
-    if len(pe_ratios) > 0:
-        min_pe = min(pe_ratios.values())
-        max_pe = max(pe_ratios.values())
-        scaled_pe = {ticker: (min_pe - pe_ratios[ticker]) / (min_pe - max_pe) for ticker in pe_ratios}
+def _fundamentals_frame(fundamentals):
+    # {ticker: {'market_cap', 'pe_ratio'}} or a ticker-indexed DataFrame -> float DataFrame
+    if isinstance(fundamentals, pd.DataFrame):
+        frame = fundamentals.reindex(columns=['market_cap', 'pe_ratio'])
     else:
-        scaled_pe = {}
+        frame = pd.DataFrame.from_dict(fundamentals, orient='index', columns=['market_cap', 'pe_ratio'])
+    return frame.astype('float64')
+
+
+def _min_max_scale(values):
+    # NaN-aware scaling to [0, 1]; NaN entries stay NaN
+    lo, hi = np.nanmin(values), np.nanmax(values)
+    return (values - lo) / (hi - lo)
+
+
+# Function to score assets on momentum, size (market cap) and value (PE ratio)
+# Each factor is min-max scaled over its whole universe and combined with
+# FACTOR_WEIGHTS (overridable per call). Returns the score Series for momentum.index.
+def score_assets(momentum, fundamentals, factor_weights=None):
+    weights = {**FACTOR_WEIGHTS, **(factor_weights or {})}
+    fund = _fundamentals_frame(fundamentals)
+    tickers = momentum.index
+
+    scaled_momentum = _min_max_scale(momentum.to_numpy(dtype='float64'))
+
+    # Size and value are scaled over every ticker that has the field, then aligned
+    caps = fund['market_cap'].dropna()
+    pes = fund['pe_ratio'].dropna()
+    scaled_size = np.zeros(len(tickers))
+    if len(caps) > 0:
+        size = pd.Series(_min_max_scale(caps.to_numpy()), index=caps.index)
+        scaled_size = size.reindex(tickers).fillna(0.0).to_numpy()
+    scaled_value = np.full(len(tickers), NEUTRAL_VALUE_SCORE)
+    if len(pes) > 0:
+        value = pd.Series(_min_max_scale(pes.to_numpy()), index=pes.index)
+        scaled_value = value.reindex(tickers).fillna(NEUTRAL_VALUE_SCORE).to_numpy()
+
+    scores = (weights['momentum'] * scaled_momentum
+              + weights['size'] * scaled_size
+              + weights['value'] * scaled_value)
+    return pd.Series(scores, index=tickers)
+
+
+# Function to build the group minimum-weight constraints as one sparse system A @ w >= b
+# A[g, i] is 1 when tickers[i] belongs to group g; groups with no member in the
+# universe are dropped since they could never be satisfied. Cached per universe.
+@lru_cache(maxsize=64)
+def group_constraint_matrix(tickers, groups, min_weight=MIN_GROUP_WEIGHT):
+    position = {tk: i for i, tk in enumerate(tickers)}
+    rows, cols = [], []
+    n_rows = 0
+    for members in groups:
+        idx = sorted({position[tk] for tk in members if tk in position})
+        if not idx:
+            continue
+        rows.extend([n_rows] * len(idx))
+        cols.extend(idx)
+        n_rows += 1
+    A = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_rows, len(tickers)))
+    b = np.full(n_rows, min_weight)
+    return A, b
+
+
+# Function to build the optimizer inputs: expected return scores mu, the covariance S
+# aligned to mu, and the (small caps, large caps, ETFs) groups. The keyword arguments
+# are optimize_portfolio's.
+def portfolio_inputs(historical_data, fundamentals, factor_weights=None, cov=None, cov_method='sample',
+                     momentum_window=MOMENTUM_WINDOW, momentum=None):
+    # 1. Momentum Factor: 6-month price change
+    if momentum is None:
+        momentum = historical_data.pct_change(momentum_window).iloc[-1]
+    momentum = momentum.dropna()
 
-    # Combine all factors into a combined expected return score
-    combined_returns = {}
-    for ticker in momentum.index:
-        combined_returns[ticker] = (
-            0.8 * scaled_momentum.get(ticker, 0) +  # 40% momentum
-            # 0.3 * scaled_size.get(ticker, 0) +      # 30% size (market cap)
-             0.2 * scaled_pe.get(ticker, 0.5)         # 30% value (PE ratio) NOTE: IF THERE IS NO PE SCORE, DONT PENALIZE, JUST ENSUREITS NEUTRAL
-        )
-        print('expected returns stock score for ', ticker, ' ', combined_returns[ticker])
+    # 2./3. Size and value factors, combined into the expected return score
+    fund = _fundamentals_frame(fundamentals)
+    mu = score_assets(momentum, fund, factor_weights)
+    logger.debug("expected return scores:\n%s", mu.to_string())
 
-        mu = pd.Series(combined_returns)
+    small_mask, large_mask, etf_mask = categorize_market_caps(fund['market_cap'])
+    small_caps = list(fund.index[small_mask])
+    large_caps = list(fund.index[large_mask])
+    etfs = list(fund.index[etf_mask])
 
     # build covariance on *all* columns, then align it to mu
-    S = risk_models.sample_cov(historical_data)
+    if cov is not None:
+        S = cov
+    elif cov_method == 'sample':
+        S = risk_models.sample_cov(historical_data)
+    else:
+        engine = CovarianceEngine.from_prices(historical_data)
+        S = engine.roll(1, len(historical_data)).covariance(cov_method, mu.index)
     S = S.reindex(index=mu.index, columns=mu.index)
 
-    print("mu shape:", mu.shape)
-    print("S shape:", S.shape)
-
-    ef = EfficientFrontier(mu, S)
-
-    # ➔ No individual asset should have more than 20%
-    ef.add_constraint(lambda w: w <= 0.20)
-
-    # ➔ Small caps should be at least 10% of total weight
-    if small_caps:
-        ef.add_constraint(lambda w: sum(w[i] for i, ticker in enumerate(ef.tickers) if ticker in small_caps) >= 0.10)
+    logger.debug("mu shape: %s, S shape: %s", mu.shape, S.shape)
+    return mu, S, (small_caps, large_caps, etfs)
 
-    # ➔ Large caps should be at least 10% of total weight
-    if large_caps:
-        ef.add_constraint(lambda w: sum(w[i] for i, ticker in enumerate(ef.tickers) if ticker in large_caps) >= 0.10)
 
-    # ➔ ETFs should be at least 10% of total weight
-    if etfs:
-        ef.add_constraint(lambda w: sum(w[i] for i, ticker in enumerate(ef.tickers) if ticker in etfs) >= 0.10)
-
-    # ➔ Now optimize
-    weights = ef.max_sharpe()
-    return ef.clean_weights()
+# Function to optimize the portfolio using momentum, size (market cap), and value (PE ratio)
+# Pass an optimizer_session.OptimizerSession to re-solve a compiled problem instead
+# of building a new EfficientFrontier (the backtester does this on every rebalance).
+# The covariance is either precomputed (cov, e.g. from a rolling CovarianceEngine)
+# or estimated here with cov_method: 'sample', 'ledoit_wolf', 'ewma' or 'factor'.
+# max_weight / min_group_weight apply without a session; a session carries its own.
+# A precomputed momentum Series (e.g. RollingWindow.momentum) skips the pct_change below.
+# With an opt_cache.OptimizerCache, problems solved before are read back instead of re-solved.
+# current_weights ({ticker: weight}, the rest cash) with a turnover_penalty or max_turnover
+# makes the solve trade-aware: it maximizes the Sharpe ratio of mu net of turnover_penalty
+# per unit of weight traded, under a one-way max_turnover. Without a session this solves a
+# one-off trade-aware OptimizerSession, so both paths return the same portfolio.
+def optimize_portfolio(historical_data, fundamentals, factor_weights=None, session=None,
+                       cov=None, cov_method='sample', momentum_window=MOMENTUM_WINDOW,
+                       max_weight=MAX_ASSET_WEIGHT, min_group_weight=MIN_GROUP_WEIGHT, momentum=None,
+                       cache=None, current_weights=None, turnover_penalty=0.0, max_turnover=None):
+    mu, S, groups = portfolio_inputs(historical_data, fundamentals, factor_weights, cov, cov_method,
+                                     momentum_window, momentum)
+    if session is not None:
+        def solve():
+            return session.solve(mu, S, groups, current=current_weights)
+        params = {'solver': 'session', 'max_weight': session.max_weight, 'min_group_weight': session.min_group_weight}
+        if session.trade_aware:
+            params.update(turnover_penalty=session.turnover_penalty, max_turnover=session.max_turnover)
+    elif current_weights is not None and (turnover_penalty > 0 or max_turnover is not None):
+        def solve():
+            from optimizer_session import OptimizerSession
+            trade_session = OptimizerSession(mu.index, max_weight, min_group_weight,
+                                             turnover_penalty=turnover_penalty, max_turnover=max_turnover)
+            return trade_session.solve(mu, S, groups, current=current_weights)
+        params = {'solver': 'session', 'max_weight': max_weight, 'min_group_weight': min_group_weight,
+                  'turnover_penalty': turnover_penalty, 'max_turnover': max_turnover}
+    else:
+        def solve():
+            # ➔ No individual asset should have more than 20% (a vector bound, not a constraint per asset)
+            ef = EfficientFrontier(mu, S, weight_bounds=(0, max_weight))
+
+            # ➔ Small caps, large caps and ETFs should each be at least 10% of total weight
+            A, b = group_constraint_matrix(tuple(mu.index), tuple(tuple(g) for g in groups), min_group_weight)
+            if A.shape[0] > 0:
+                ef.add_constraint(lambda w: A @ w >= b)
+
+            # ➔ Now optimize
+            weights = ef.max_sharpe()
+            return ef.clean_weights()
+        params = {'solver': 'efficient_frontier', 'max_weight': max_weight, 'min_group_weight': min_group_weight}
+
+    if current_weights is not None and 'turnover_penalty' in params:
+        # The solution depends on where the portfolio starts from
+        params['current'] = {str(tk): round(float(w), 8) for tk, w in current_weights.items() if w > 0}
+
+    if cache is None:
+        return solve()
+    return cache.cached(cache.fingerprint(mu, S, groups, **params), solve)
 
 
 
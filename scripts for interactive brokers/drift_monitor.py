@@ -0,0 +1,110 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from constraints import ConstraintSet
+from data_fetcher import MAX_ASSET_WEIGHT, MIN_GROUP_WEIGHT
+
+
+DRIFT_BAND = 0.05                   # a weight this far from its target triggers a rebalance
+MONITOR_STATE = "drift_monitor.json"
+
+
+def price_returns(prices, previous):
+    """Simple returns between two price vectors; 0 where either price is missing."""
+    prices = np.asarray(prices, dtype='float64')
+    previous = np.asarray(previous, dtype='float64')
+    ok = (previous > 0) & (prices > 0)
+    return np.divide(prices, previous, out=np.ones(len(prices)), where=ok) - 1
+
+
+class DriftMonitor:
+    """Portfolio weights carried forward from daily returns between rebalances.
+
+    Holding still moves a weight vector w (the rest is cash) by
+    w <- w * (1 + r) / (1 + w . r), so a day costs two O(N) vector operations
+    and needs no holdings, account value or optimizer. ``update`` returns the
+    reason to rebalance when a weight has drifted more than ``band`` from its
+    target ('band', skipped when band is None) or a ConstraintSet rule breaks
+    ('constraints'), and None on the days that need nothing.
+    """
+
+    def __init__(self, assets, constraints=None, band=DRIFT_BAND):
+        self.assets = pd.Index(assets)
+        self.constraints = constraints
+        self.band = band
+        self.weights = np.zeros(len(self.assets))
+        self.target = np.zeros(len(self.assets))
+        self.prices = None          # last prices seen by update_prices (live use)
+
+    def reset(self, weights, target=None):
+        """Start a new holding period from ``weights``, drifting away from ``target`` (default: weights)."""
+        self.weights = np.array(weights, dtype='float64')
+        self.target = self.weights.copy() if target is None else np.array(target, dtype='float64')
+
+    def drift(self, returns):
+        self.weights = self.weights * (1.0 + returns) / (1.0 + self.weights @ returns)
+        return self.weights
+
+    def check(self, i=0):
+        if self.constraints is not None and self.constraints.breached(self.weights, i):
+            return 'constraints'
+        if self.band is not None and np.abs(self.weights - self.target).max() > self.band:
+            return 'band'
+        return None
+
+    def update(self, returns, i=0):
+        self.drift(returns)
+        return self.check(i)
+
+    def update_prices(self, prices, i=0):
+        """``update`` from a {ticker: price} snapshot; the first snapshot only sets the reference prices."""
+        prices = pd.Series(prices, dtype='float64').reindex(self.assets).to_numpy()
+        if self.prices is None:
+            self.prices = prices
+            return self.check(i)
+        returns = price_returns(prices, self.prices)
+        self.prices = np.where(prices > 0, prices, self.prices)
+        return self.update(returns, i)
+
+    def get_state(self):
+        return {'weights': self.weights, 'target': self.target}
+
+    def set_state(self, state):
+        self.reset(state['weights'], state['target'])
+        return self
+
+    # ------------ Live state file ------------
+
+    def save(self, path=MONITOR_STATE, time=None):
+        groups = {}
+        if self.constraints is not None:
+            members = self.constraints.members[-1]
+            groups = {name: list(self.assets[members[g] > 0]) for g, name in enumerate(self.constraints.names)}
+        state = {'assets': [str(a) for a in self.assets], 'weights': self.weights.tolist(),
+                 'target': self.target.tolist(), 'band': self.band, 'groups': groups,
+                 'prices': None if self.prices is None else np.nan_to_num(self.prices).tolist(),
+                 'max_weight': getattr(self.constraints, 'max_weight', MAX_ASSET_WEIGHT),
+                 'min_group_weight': getattr(self.constraints, 'min_group_weight', MIN_GROUP_WEIGHT),
+                 'time': None if time is None else str(time)}
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=MONITOR_STATE):
+        """The monitor saved after the last live rebalance, or None if there is none."""
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        assets = pd.Index(state['assets'])
+        constraints = None
+        if state['groups']:
+            constraints = ConstraintSet(assets, {name: assets.isin(members) for name, members in state['groups'].items()},
+                                        state['max_weight'], state['min_group_weight'])
+        monitor = cls(assets, constraints, state['band']).set_state(state)
+        if state['prices'] is not None:
+            monitor.prices = np.array(state['prices'], dtype='float64')
+        return monitor
@@ -0,0 +1,177 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+from data_fetcher import portfolio_inputs, MAX_ASSET_WEIGHT, MIN_GROUP_WEIGHT
+from optimizer_session import OptimizerSession
+from opt_cache import OptimizerCache
+
+FRONTIER_RESULTS = "frontier.csv"
+FRONTIER_CACHE_DIR = "frontier_cache"
+FRONTIER_POINTS = 50
+MAX_WORKERS = os.cpu_count() or 1
+MIN_POINTS_PER_WORKER = 10      # below this a worker's compile time outweighs its share of the solves
+
+
+class FrontierSession(OptimizerSession):
+    """OptimizerSession that also solves points on the efficient frontier.
+
+    Besides the max-Sharpe problem it compiles two more on the same Parameters:
+    minimum variance for a target return, and maximum return for a target
+    variance. ``load`` sets mu, the covariance and the groups once; every
+    ``point`` after that only moves the target and re-solves with warm start.
+    Weights are fully invested, long only, capped at ``max_weight`` and meet
+    the group minimums, as in ``solve``.
+    """
+
+    def __init__(self, assets, max_weight=MAX_ASSET_WEIGHT, min_group_weight=MIN_GROUP_WEIGHT, solver=None):
+        super().__init__(assets, max_weight, min_group_weight, solver)
+        self.w = cp.Variable(len(self.assets))
+        self.target_return = cp.Parameter()
+        self.target_variance = cp.Parameter(nonneg=True)
+        rules = [cp.sum(self.w) == 1, self.w >= 0, self.w <= self.upper, self.groups @ self.w >= self.group_min]
+        variance = cp.sum_squares(self.cov_root.T @ self.w)
+        self.problems = {
+            'return': cp.Problem(cp.Minimize(variance), rules + [self.mu @ self.w >= self.target_return]),
+            'risk': cp.Problem(cp.Maximize(self.mu @ self.w), rules + [variance <= self.target_variance]),
+        }
+        self.loaded = None
+
+    def load(self, mu, S, groups=()):
+        self._set_parameters(mu, S, groups)
+        self.loaded = (mu, np.asarray(S, dtype='float64'), groups)
+        return self
+
+    def point(self, kind, target):
+        """Weights over the loaded mu.index at a target return or volatility, or None if it cannot be met."""
+        mu, S, _ = self.loaded
+        if kind == 'return':
+            self.target_return.value = float(target)
+        else:
+            self.target_variance.value = float(target) ** 2
+        problem = self.problems[kind]
+        problem.solve(solver=self.solver, warm_start=True)
+        self.solves += 1
+        if problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self.w.value is None:
+            return None
+        idx = np.array([self.position[tk] for tk in mu.index])
+        weights = self.w.value[idx]
+        weights[np.abs(weights) < 1e-4] = 0
+        return np.round(weights, 5) + 0.0
+
+    def min_volatility(self):
+        mu, _, _ = self.loaded
+        return self.point('return', mu.min() - 1)       # the return target never binds
+
+    def max_return(self):
+        _, S, _ = self.loaded
+        return self.point('risk', np.sqrt(np.diag(S).max()))   # no long-only portfolio is riskier
+
+    def max_sharpe(self):
+        mu, S, groups = self.loaded
+        return np.array(list(self.solve(mu, S, groups).values()))
+
+
+def _row(point, kind, target, weights, mu, S):
+    ret = float(mu @ weights)
+    vol = float(np.sqrt(max(weights @ S @ weights, 0.0)))
+    return {'point': point, 'kind': kind, 'target': target, 'return': ret, 'volatility': vol,
+            'sharpe': ret / vol if vol > 0 else np.nan, **dict(zip(mu.index, weights))}
+
+
+# ------------ Workers ------------
+
+_worker = {}
+
+
+def _load_worker(mu, S, groups, max_weight, min_group_weight):
+    _worker['session'] = FrontierSession(mu.index, max_weight, min_group_weight).load(mu, S, groups)
+
+
+def _solve_targets(kind, targets):
+    session = _worker['session']
+    mu, S, _ = session.loaded
+    rows = []
+    for target in targets:
+        weights = session.point(kind, target)
+        if weights is None:
+            print(f"[WARN] No frontier portfolio at {kind} {target:.4f}")
+            continue
+        rows.append(_row('frontier', kind, target, weights, mu, S))
+    return rows
+
+
+# ------------ Frontier table ------------
+
+# Function to compute the efficient frontier for one set of optimizer inputs
+# ``kind`` spaces the points evenly in target return ('return') or volatility ('risk')
+# between the minimum-volatility and maximum-return portfolios. Contiguous runs
+# of targets go to a process pool, each worker compiling its session once; the
+# table (one row per point: labels, return, volatility, sharpe and the weights)
+# is cached in ``cache_dir`` by a fingerprint of the inputs.
+def frontier_table(mu, S, groups, n_points=FRONTIER_POINTS, kind='return', max_weight=MAX_ASSET_WEIGHT,
+                   min_group_weight=MIN_GROUP_WEIGHT, max_workers=MAX_WORKERS, cache_dir=FRONTIER_CACHE_DIR):
+    S = S.reindex(index=mu.index, columns=mu.index)
+    path = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        key = OptimizerCache.fingerprint(mu, S, groups, kind=kind, n_points=n_points, max_weight=max_weight,
+                                         min_group_weight=min_group_weight)
+        path = os.path.join(cache_dir, key + ".csv")
+        if os.path.exists(path):
+            return pd.read_csv(path)
+
+    _load_worker(mu, S, groups, max_weight, min_group_weight)
+    session = _worker['session']
+    cov = session.loaded[1]
+    ends = {'min_volatility': session.min_volatility(), 'max_return': session.max_return()}
+    if any(weights is None for weights in ends.values()):
+        raise ValueError("The constraints leave no feasible portfolio")
+    ends['max_sharpe'] = session.max_sharpe()
+    special = [_row(name, kind, np.nan, weights, mu, cov) for name, weights in ends.items()]
+    column = 'return' if kind == 'return' else 'volatility'
+    targets = np.linspace(special[0][column], special[1][column], n_points)
+    # The two ends are the min-volatility and max-return portfolios themselves
+    first, last = ({**row, 'point': 'frontier', 'target': t} for row, t in zip(special[:2], targets[[0, -1]]))
+    targets = targets[1:-1]
+
+    workers = max(1, min(max_workers, len(targets) // MIN_POINTS_PER_WORKER))
+    if workers == 1:
+        rows = _solve_targets(kind, targets)
+    else:
+        print(f"[INFO] Solving {len(targets)} frontier points on {workers} workers...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_load_worker,
+                                 initargs=(mu, S, groups, max_weight, min_group_weight)) as pool:
+            chunks = pool.map(_solve_targets, [kind] * workers, np.array_split(targets, workers))
+            rows = [row for chunk in chunks for row in chunk]
+
+    table = pd.DataFrame([first] + rows + [last] + special)
+    if path is not None:
+        tmp_path = path + ".tmp"
+        table.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return table
+
+
+# Function to compute the frontier from prices and fundamentals, like optimize_portfolio
+def frontier(historical_data, fundamentals, factor_weights=None, n_points=FRONTIER_POINTS, kind='return', **kwargs):
+    mu, S, groups = portfolio_inputs(historical_data, fundamentals, factor_weights)
+    return frontier_table(mu, S, groups, n_points, kind, **kwargs)
+
+
+def main():
+    from data_fetcher import fetch_historical_data
+    from fundamentals import load_fundamentals
+    from main import TICKERS
+
+    historical_data = fetch_historical_data(TICKERS)
+    fundamentals = load_fundamentals(TICKERS)
+    table = frontier(historical_data, fundamentals)
+    table.to_csv(FRONTIER_RESULTS, index=False)
+    print(table[['point', 'target', 'return', 'volatility', 'sharpe']].to_string(index=False))
+    print(f"Frontier of {len(table)} points saved to {FRONTIER_RESULTS}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+
+FUNDAMENTALS_CACHE = "fundamentals_cache.json"
+FUNDAMENTALS_TTL = 24 * 60 * 60   # seconds before a cached entry is fetched again
+MAX_WORKERS = 8
+FIELDS = ('market_cap', 'pe_ratio')
+
+
+# ------------ Sources ------------
+# A source is any callable ticker -> {'market_cap': ..., 'pe_ratio': ...} or None.
+
+def yf_source(ticker):
+    info = yf.Ticker(ticker).info
+    return {'market_cap': info.get('marketCap'), 'pe_ratio': info.get('trailingPE')}
+
+
+def snapshot_source(path):
+    """Source backed by a local CSV/Parquet file with ticker, market_cap and pe_ratio columns."""
+    frame = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    frame = frame.set_index('ticker')[list(FIELDS)].astype('float64')
+    frame = frame.astype(object).where(frame.notna(), None)
+    rows = frame.to_dict('index')
+
+    def source(ticker):
+        return rows.get(ticker)
+    return source
+
+
+# ------------ Cache ------------
+
+class FundamentalsCache:
+    """JSON cache of per-ticker fundamentals with a time-to-live.
+
+    ``path=None`` keeps the cache in memory only (useful with snapshot sources).
+    """
+
+    def __init__(self, path=FUNDAMENTALS_CACHE, ttl=FUNDAMENTALS_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, ticker):
+        entry = self.entries.get(ticker)
+        if entry is None or time.time() - entry['fetched_at'] > self.ttl:
+            return None
+        return {field: entry[field] for field in FIELDS}
+
+    def put(self, ticker, data):
+        self.entries[ticker] = {'fetched_at': time.time(), **{f: data.get(f) for f in FIELDS}}
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _fetch_one(source, ticker):
+    try:
+        return source(ticker), None
+    except Exception as e:
+        return None, e
+
+
+# Function to load market cap / PE ratio for many tickers
+# Cached entries younger than the TTL are used as-is; the rest are fetched on a
+# thread pool. Tickers without a market cap are skipped, as in fetch_fundamentals_yf.
+def load_fundamentals(tickers, source=None, cache=None, max_workers=MAX_WORKERS):
+    source = source or yf_source
+    cache = cache if cache is not None else FundamentalsCache()
+
+    results, misses = {}, []
+    for tk in tickers:
+        hit = cache.get(tk)
+        if hit is None:
+            misses.append(tk)
+        else:
+            results[tk] = hit
+
+    if misses:
+        print(f"[INFO] Fetching fundamentals for {len(misses)} tickers ({len(results)} cached)...")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            fetched = pool.map(lambda tk: _fetch_one(source, tk), misses)
+            for tk, (data, error) in zip(misses, fetched):
+                if error is not None:
+                    print(f"[WARN] Fundamentals fetch failed for {tk}: {error}")
+                    continue
+                data = {field: (data or {}).get(field) for field in FIELDS}
+                cache.put(tk, data)
+                results[tk] = data
+        cache.save()
+
+    fundamentals = {}
+    for tk in tickers:
+        data = results.get(tk)
+        if data is None or data.get('market_cap') is None:
+            print(f"⚠️ Market Cap missing for {tk}, skipping this stock.")
+            continue
+        fundamentals[tk] = {'pe_ratio': data['pe_ratio'], 'market_cap': data['market_cap']}
+    return fundamentals
+
+
+# ------------ Point-in-time store ------------
+# Backtests must only see fundamentals that were public on each date. The store
+# keeps the slowly changing inputs (shares outstanding, trailing EPS) as change
+# points per ticker; market cap and PE are derived from the price on the query
+# date, so they move with the price exactly as a live snapshot would.
+
+PIT_STORE = "fundamentals_pit.parquet"
+REPORTING_LAG_DAYS = 45          # quarterly statements assumed public 45 days after period end
+ANNUAL_REPORTING_LAG_DAYS = 90
+PIT_FIELDS = ('shares', 'eps_ttm')
+EPS_RESTATED_FOR_SPLITS = True   # Yahoo restates statement EPS for later splits; as-reported EPS would need adjusting
+PIT_REFRESH_DAYS = 7             # tickers fetched longer ago than this are fetched again for new statements
+
+
+def _empty_pit_rows(ticker, start):
+    return pd.DataFrame({'ticker': [ticker], 'asof': [pd.Timestamp(start)],
+                         'shares': [float('nan')], 'eps_ttm': [float('nan')], 'split_adjusted': [True]})
+
+
+def split_factors(splits, dates):
+    """Product of the split ratios after each date.
+
+    Adjusted prices are on the basis of the latest share count, so an
+    as-reported share count is multiplied (and a per-share figure divided) by
+    this factor to match them.
+    """
+    dates = pd.DatetimeIndex(dates)
+    if splits is None or len(splits) == 0:
+        return np.ones(len(dates))
+    splits = splits[splits > 0]
+    split_dates = pd.to_datetime(splits.index)
+    if split_dates.tz is not None:
+        split_dates = split_dates.tz_localize(None)
+    order = np.argsort(split_dates.values)
+    ratios = splits.to_numpy(dtype='float64')[order]
+    # after[k] is the product of the ratios of splits k, k+1, ...
+    after = np.append(np.cumprod(ratios[::-1])[::-1], 1.0)
+    return after[np.searchsorted(split_dates.normalize().values[order], dates.values, side='right')]
+
+
+def yf_pit_source(ticker, start):
+    """Shares outstanding and trailing EPS change points for one ticker from yfinance.
+
+    Share counts are as reported, so they are put on the split basis of the
+    adjusted prices with the ticker's split history. yfinance only exposes a
+    few years of statements; dates before the earliest point have no
+    fundamentals unless PointInTimeFundamentals.align is asked to backfill.
+    """
+    stock = yf.Ticker(ticker)
+    splits = stock.splits
+    rows = []
+
+    shares = stock.get_shares_full(start=start)
+    if shares is not None and len(shares) > 0:
+        shares.index = pd.to_datetime(shares.index).tz_localize(None).normalize()
+        shares = shares.groupby(level=0).last()
+        adjusted = shares.values.astype('float64') * split_factors(splits, shares.index)
+        rows.append(pd.DataFrame({'asof': shares.index, 'shares': adjusted}))
+
+    def eps_rows(eps, lag_days):
+        periods = pd.to_datetime(eps.index)
+        values = eps.values.astype('float64')
+        if not EPS_RESTATED_FOR_SPLITS:
+            values = values / split_factors(splits, periods)
+        return pd.DataFrame({'asof': periods + pd.Timedelta(days=lag_days), 'eps_ttm': values})
+
+    annual = stock.income_stmt
+    if annual is not None and 'Diluted EPS' in annual.index:
+        rows.append(eps_rows(annual.loc['Diluted EPS'].dropna(), ANNUAL_REPORTING_LAG_DAYS))
+
+    quarterly = stock.quarterly_income_stmt
+    if quarterly is not None and 'Diluted EPS' in quarterly.index:
+        eps = quarterly.loc['Diluted EPS'].dropna().sort_index()
+        rows.append(eps_rows(eps.rolling(4).sum().dropna(), REPORTING_LAG_DAYS))
+
+    if not rows:
+        return _empty_pit_rows(ticker, start)
+    frame = pd.concat(rows, ignore_index=True)
+    frame['ticker'] = ticker
+    frame['split_adjusted'] = True
+    return frame
+
+
+class PointInTimeFundamentals:
+    """(ticker, as-of date) table of shares outstanding and trailing EPS."""
+
+    def __init__(self, table):
+        table = table.reindex(columns=['ticker', 'asof', *PIT_FIELDS, 'split_adjusted', 'fetched_at'])
+        table['split_adjusted'] = table['split_adjusted'].fillna(False).astype(bool)
+        table['ticker'] = table['ticker'].astype('category')
+        table['asof'] = pd.to_datetime(table['asof'])
+        table['fetched_at'] = pd.to_datetime(table['fetched_at'])
+        table['shares'] = table['shares'].astype('float64')
+        table['eps_ttm'] = table['eps_ttm'].astype('float32')
+        self.table = table.sort_values(['ticker', 'asof'], kind='stable').reset_index(drop=True)
+
+    @classmethod
+    def load(cls, path=PIT_STORE):
+        return cls(pd.read_parquet(path))
+
+    def save(self, path=PIT_STORE):
+        self.table.to_parquet(path, index=False)
+
+    @property
+    def tickers(self):
+        return set(self.table['ticker'].astype(str))
+
+    def _as_of_matrix(self, field, index, columns, backfill):
+        points = self.table.dropna(subset=[field])
+        wide = (points.drop_duplicates(['ticker', 'asof'], keep='last')
+                .pivot(index='asof', columns='ticker', values=field))
+        wide.columns = wide.columns.astype(str)
+        wide = wide.reindex(columns=columns)
+        # As-of join for every (date, ticker) at once: forward-fill change points onto the date grid
+        grid = wide.reindex(wide.index.union(index)).ffill()
+        if backfill:
+            grid = grid.bfill()
+        return grid.reindex(index)
+
+    def align(self, prices, backfill=False):
+        """Market cap and PE valid on each row of a date x ticker price frame.
+
+        Returns ``(market_caps, pe_ratios)`` shaped like ``prices``. Dates
+        before a ticker's first point have none, so the ticker stays out of
+        those rebalances. ``backfill`` uses the earliest known shares/EPS for
+        them instead; that reads statements from the future, so it is off by
+        default. A non-positive trailing EPS gives no PE, matching yfinance's
+        trailingPE.
+        """
+        shares = self._as_of_matrix('shares', prices.index, prices.columns, backfill)
+        eps = self._as_of_matrix('eps_ttm', prices.index, prices.columns, backfill)
+        market_caps = prices * shares
+        pe_ratios = prices / eps.where(eps > 0)
+        return market_caps, pe_ratios
+
+
+def fundamentals_on(market_caps, pe_ratios, date, tickers=None):
+    """``{ticker: {'pe_ratio', 'market_cap'}}`` snapshot for one date of aligned matrices."""
+    frame = pd.DataFrame({'pe_ratio': pe_ratios.loc[date], 'market_cap': market_caps.loc[date]})
+    if tickers is not None:
+        frame = frame.reindex(tickers)
+    frame = frame[frame['market_cap'].notna()]
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict('index')
+
+
+def _merge_points(old, new):
+    # A refetch only sees the statements yfinance still exposes, so older change points are kept
+    old = old.copy()
+    for field in PIT_FIELDS:
+        fresh = new.loc[new[field].notna(), 'asof']
+        if len(fresh):
+            old.loc[old['asof'] >= fresh.min(), field] = np.nan
+    old = old.dropna(subset=list(PIT_FIELDS), how='all')
+    return pd.concat([old, new], ignore_index=True)
+
+
+# Function to load the point-in-time store, fetching tickers it has never seen
+# and refetching those last fetched more than ``refresh_days`` ago for new statements
+def load_pit_fundamentals(tickers, start, path=PIT_STORE, source=None, max_workers=MAX_WORKERS,
+                          refresh_days=PIT_REFRESH_DAYS):
+    source = source or yf_pit_source
+    now = pd.Timestamp.now()
+    table = pd.read_parquet(path) if os.path.exists(path) else None
+    if table is not None and not table.get('split_adjusted', pd.Series(False)).astype(bool).all():
+        print(f"[WARN] {path} has share counts that are not split-adjusted; rebuilding it")
+        table = None
+    if table is not None:
+        table = PointInTimeFundamentals(table).table
+        table['ticker'] = table['ticker'].astype(str)
+        fetched_at = table.groupby('ticker')['fetched_at'].max()
+    else:
+        fetched_at = pd.Series(dtype='datetime64[ns]')
+    missing = [tk for tk in tickers if tk not in fetched_at.index]
+    stale = [tk for tk in tickers if tk in fetched_at.index
+             and not fetched_at[tk] >= now - pd.Timedelta(days=refresh_days)]
+    if not missing and not stale:
+        return PointInTimeFundamentals(table)
+
+    print(f"[INFO] Fetching point-in-time fundamentals for {len(missing)} new and {len(stale)} stale tickers...")
+    fresh = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        fetched = pool.map(lambda tk: _fetch_one(lambda t: source(t, start), tk), missing + stale)
+        for tk, (rows, error) in zip(missing + stale, fetched):
+            if error is not None:
+                print(f"[WARN] Point-in-time fundamentals failed for {tk}: {error}")
+                continue
+            fresh[tk] = rows.assign(fetched_at=now)
+    if table is None and not fresh:
+        raise RuntimeError(f"No point-in-time fundamentals could be fetched for any of {len(missing)} tickers")
+    if not fresh:
+        return PointInTimeFundamentals(table)
+
+    frames = [] if table is None else [table[~table['ticker'].isin(list(fresh))]]
+    for tk, rows in fresh.items():
+        frames.append(rows if tk not in fetched_at.index else _merge_points(table[table['ticker'] == tk], rows))
+    store = PointInTimeFundamentals(pd.concat(frames, ignore_index=True))
+    store.save(path)
+    return store
@@ -2,7 +2,7 @@ from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.order import Order
-from threading import Thread
+from threading import Thread, Lock
 import time
 
 class IBApi(EWrapper, EClient):
@@ -58,3 +58,36 @@ def market_order(action, quantity):
     order.orderType = "MKT"
     order.totalQuantity = quantity
     return order
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace requests sent to TWS."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate  # tokens added per second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Block only as long as it takes for the next token to arrive
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        # Push the bucket into debt so nothing is sent for roughly `seconds`
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
@@ -1,5 +1,10 @@
-from data_fetcher import fetch_historical_data, optimize_portfolio, fetch_latest_prices, fetch_fundamentals_yf
-from trader import rebalance_portfolio, get_account_value
+import pandas as pd
+from data_fetcher import fetch_historical_data, optimize_portfolio, fetch_latest_prices, categorize_stocks
+from fundamentals import load_fundamentals
+from trader import rebalance_portfolio, get_account_value, get_current_weights
+from optimizer_session import OptimizerSession
+from constraints import ConstraintSet
+from drift_monitor import DriftMonitor, DRIFT_BAND, MONITOR_STATE
 
 # Individual US Stocks
 STOCK_TICKERS = [
@@ -151,16 +156,68 @@ MARKET_ETFS = [
 # Combined Ticker List
 TICKERS = STOCK_TICKERS + SECTOR_ETFS + MARKET_ETFS
 
+# Opt-in drift mode: only re-optimize when the account's current weights break a
+# constraint or leave the DRIFT_BAND around the targets of the last rebalance
+# (drift_monitor.json); the first run, or one without the state file, always rebalances
+REBALANCE_ON_DRIFT = False
+
+# Opt-in trade-aware optimization: start from the account's current weights, charge
+# TURNOVER_PENALTY (in expected-return score units) per unit of weight traded,
+# cap one-way turnover at MAX_TURNOVER (None for no cap) and skip orders
+# smaller than MIN_TRADE_VALUE dollars
+TRADE_AWARE = False
+TURNOVER_PENALTY = 0.01
+MAX_TURNOVER = None
+MIN_TRADE_VALUE = 250.0
+
+
+# Function to get the account's current weights as a vector over the monitor's assets
+# Filled positions, not the targets, so rejected, partial or manual trades are seen.
+def held_weights(assets, latest_prices):
+    return pd.Series(get_current_weights(latest_prices), dtype='float64').reindex(assets, fill_value=0.0).to_numpy()
+
+
+# Function to save the monitor for the next run: the positions after the rebalance and its targets
+def save_monitor(allocations, fundamentals, latest_prices):
+    small_caps, large_caps, etfs = categorize_stocks(fundamentals)
+    assets = pd.Index(TICKERS)
+    constraints = ConstraintSet(assets, {'small_caps': assets.isin(small_caps), 'large_caps': assets.isin(large_caps),
+                                         'etfs': assets.isin(etfs)})
+    monitor = DriftMonitor(assets, constraints, DRIFT_BAND)
+    target = pd.Series(allocations, dtype='float64').reindex(assets, fill_value=0.0).to_numpy()
+    monitor.reset(held_weights(assets, latest_prices), target)
+    monitor.save(MONITOR_STATE, time=pd.Timestamp.now())
+
 
 def main():
     print("🔍 Fetching historical data...")
     historical_data = fetch_historical_data(TICKERS)
 
+    print("💹 Fetching latest prices...")
+    latest_prices = fetch_latest_prices(TICKERS, history=historical_data)
+
+    monitor = DriftMonitor.load(MONITOR_STATE) if REBALANCE_ON_DRIFT else None
+    if monitor is not None:
+        print("📏 Checking the account's weights against the last rebalance...")
+        monitor.reset(held_weights(monitor.assets, latest_prices), monitor.target)
+        reason = monitor.check()
+        if reason is None:
+            monitor.save(MONITOR_STATE, time=pd.Timestamp.now())
+            print("✅ Constraints hold and weights are within the drift band; no rebalance needed.")
+            return
+        print(f"⚠️ Rebalance triggered ({reason}).")
+
     print("🧠 Fetching fundamental data (PE ratio, market cap)...")
-    fundamentals = {ticker: fetch_fundamentals_yf(ticker) for ticker in TICKERS}
+    fundamentals = load_fundamentals(TICKERS)
 
     print("🧠 Optimizing portfolio...")
-    weights = optimize_portfolio(historical_data, fundamentals)  # Pass fundamentals here
+    if TRADE_AWARE:
+        current_weights = get_current_weights(latest_prices)
+        print(f"📍 Current weights: {len(current_weights)} positions, {sum(current_weights.values()):.1%} invested")
+        session = OptimizerSession(TICKERS, turnover_penalty=TURNOVER_PENALTY, max_turnover=MAX_TURNOVER)
+        weights = optimize_portfolio(historical_data, fundamentals, session=session, current_weights=current_weights)
+    else:
+        weights = optimize_portfolio(historical_data, fundamentals)  # Pass fundamentals here
 
     print("💰 Fetching account value...")
     capital = get_account_value()
@@ -169,9 +226,6 @@ def main():
         capital = 10000.0
     print(f"✅ Capital available for allocation: ${capital:.2f}")
 
-    print("💹 Fetching latest prices...")
-    latest_prices = fetch_latest_prices(TICKERS)
-
     print("📊 Calculating target allocations...")
     allocations = {
         symbol: weights.get(symbol, 0.0)
@@ -184,7 +238,9 @@ def main():
     print(f"💸 Estimated cash remaining after allocation: ${cash_remaining:.2f}")
 
     print("🔁 Rebalancing portfolio...")
-    rebalance_portfolio(allocations, latest_prices)
+    rebalance_portfolio(allocations, latest_prices, min_trade_value=MIN_TRADE_VALUE if TRADE_AWARE else 0.0)
+    if REBALANCE_ON_DRIFT:
+        save_monitor(allocations, fundamentals, latest_prices)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+import threading
+import time
+import pandas as pd
+from ib_client import TokenBucket, stock_contract
+
+
+# IB keeps at most 50 historical requests open at once and answers bursts
+# beyond its pacing limits with error 162, so requests go through a token bucket.
+HIST_MAX_IN_FLIGHT = 50
+HIST_BURST = 50
+HIST_RATE = 2.0            # historical requests per second once the burst is spent
+PACING_VIOLATION = 162
+PACING_BACKOFF = 10.0      # seconds to hold off after a pacing violation
+MAX_PACING_RETRIES = 2
+
+# Snapshots hold a market data line until they complete (100 lines by default)
+# and TWS accepts roughly 50 messages per second.
+SNAPSHOT_MAX_IN_FLIGHT = 90
+SNAPSHOT_BURST = 40
+SNAPSHOT_RATE = 40.0
+DELAYED_DATA = 3           # live data is still returned when subscribed
+LAST_TICKS = (4, 68)       # LAST, DELAYED_LAST
+CLOSE_TICKS = (9, 75)      # CLOSE, DELAYED_CLOSE
+
+
+# Notices sent on a live request that still returns data: delayed data is being
+# displayed (10167) or substituted for a missing subscription (10089-10091)
+MARKET_DATA_NOTICES = (10089, 10090, 10091, 10167)
+
+
+def is_warning(error_code):
+    # 21xx codes are farm-status/informational messages, not request failures
+    return 2100 <= error_code < 2200 or error_code in MARKET_DATA_NOTICES
+
+
+# Shared plumbing for apps that keep many requests in flight on one connection
+class BatchApp(EWrapper, EClient):
+    def __init__(self, max_in_flight):
+        EClient.__init__(self, self)
+        self.connected_event = threading.Event()
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.errors = {}
+        self.done = {}
+
+    def nextValidId(self, orderId: int):
+        self.connected_event.set()
+
+    def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=""):
+        if reqId in self.done and not is_warning(errorCode):
+            self.errors[reqId] = (errorCode, errorString)
+            self._finish(reqId)
+        else:
+            super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
+
+    def _finish(self, reqId):
+        with self.lock:
+            event = self.done.get(reqId)
+            if event is None or event.is_set():
+                return
+            event.set()
+        self.slots.release()
+
+
+def _start(app, client_id):
+    app.connect("127.0.0.1", 7497, clientId=client_id)
+    thread = threading.Thread(target=app.run, daemon=True)
+    thread.start()
+    return thread
+
+
+# ------------ Historical Bars ------------
+
+class HistoricalApp(BatchApp):
+    def __init__(self, max_in_flight=HIST_MAX_IN_FLIGHT):
+        BatchApp.__init__(self, max_in_flight)
+        self.bars = {}
+
+    def historicalData(self, reqId, bar):
+        with self.lock:
+            self.bars.setdefault(reqId, []).append((bar.date, bar.close))
+
+    def historicalDataEnd(self, reqId, start, end):
+        self._finish(reqId)
+
+
+def _is_pacing_error(error):
+    code, message = error
+    return code == PACING_VIOLATION and "pacing" in message.lower()
+
+
+def fetch_closes(tickers, duration='1 Y', bar_size='1 day', what_to_show='ADJUSTED_LAST',
+                 timeout=120, client_id=1002, bucket=None):
+    """Fetch close bars for many tickers concurrently over a single IB connection.
+
+    ``duration`` is either one IB duration string for every ticker or a dict of
+    ticker -> duration, so cached tickers can ask only for their missing bars.
+
+    Returns ``(closes, errors)``: ``closes`` maps ticker -> close Series indexed by
+    the raw bar timestamp, ``errors`` maps every ticker that could not be fetched
+    to a message.
+    """
+    app = HistoricalApp()
+    thread = _start(app, client_id)
+
+    if not app.connected_event.wait(timeout=5):
+        app.disconnect()
+        return {}, {tk: "could not connect to TWS" for tk in tickers}
+
+    bucket = bucket or TokenBucket(HIST_BURST, HIST_RATE)
+    deadline = time.monotonic() + timeout
+    closes, errors = {}, {}
+    pending = list(tickers)
+    next_id = 1
+
+    for attempt in range(MAX_PACING_RETRIES + 1):
+        requests = {}
+        for tk in pending:
+            if not app.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                errors[tk] = "timed out waiting for a free request slot"
+                continue
+            bucket.acquire()
+            with app.lock:
+                app.done[next_id] = threading.Event()
+            requests[next_id] = tk
+            tk_duration = duration[tk] if isinstance(duration, dict) else duration
+            app.reqHistoricalData(next_id, stock_contract(tk), "", tk_duration, bar_size,
+                                  what_to_show, 1, 1, False, [])
+            next_id += 1
+
+        for req_id, tk in requests.items():
+            if not app.done[req_id].wait(timeout=max(0.0, deadline - time.monotonic())):
+                app.cancelHistoricalData(req_id)
+                app._finish(req_id)
+                errors[tk] = "timed out waiting for historical data"
+
+        pending = []
+        for req_id, tk in requests.items():
+            if req_id in app.errors:
+                if _is_pacing_error(app.errors[req_id]) and attempt < MAX_PACING_RETRIES:
+                    pending.append(tk)
+                else:
+                    code, message = app.errors[req_id]
+                    errors[tk] = f"[{code}] {message}"
+            elif tk not in errors:
+                bars = app.bars.get(req_id, [])
+                if not bars:
+                    errors[tk] = "no bars returned"
+                    continue
+                dates, values = zip(*bars)
+                closes[tk] = pd.Series(values, index=pd.Index(dates, name='timestamp'), name=tk)
+
+        if not pending:
+            break
+        print(f"[WARN] Pacing violation on {len(pending)} requests, backing off {PACING_BACKOFF:.0f}s")
+        bucket.penalize(PACING_BACKOFF)
+
+    app.disconnect()
+    thread.join(timeout=2)
+
+    return closes, errors
+
+
+# ------------ Snapshot Prices ------------
+
+class SnapshotApp(BatchApp):
+    def __init__(self, max_in_flight=SNAPSHOT_MAX_IN_FLIGHT):
+        BatchApp.__init__(self, max_in_flight)
+        self.last = {}
+        self.close = {}
+
+    def tickPrice(self, reqId, tickType, price, attrib):
+        if price <= 0:
+            return
+        if tickType in LAST_TICKS:
+            self.last[reqId] = price
+        elif tickType in CLOSE_TICKS:
+            self.close[reqId] = price
+
+    def tickSnapshotEnd(self, reqId):
+        self._finish(reqId)
+
+
+def fetch_snapshot_prices(tickers, timeout=15, client_id=1003, market_data_type=DELAYED_DATA, bucket=None):
+    """Request one reqMktData snapshot per ticker over a single IB connection.
+
+    Returns ``(prices, errors)``: the last traded price (previous close when no
+    trade is reported) per ticker, and a message for every ticker without one.
+    """
+    app = SnapshotApp()
+    thread = _start(app, client_id)
+
+    if not app.connected_event.wait(timeout=5):
+        app.disconnect()
+        return {}, {tk: "could not connect to TWS" for tk in tickers}
+
+    app.reqMarketDataType(market_data_type)
+    bucket = bucket or TokenBucket(SNAPSHOT_BURST, SNAPSHOT_RATE)
+    deadline = time.monotonic() + timeout
+    prices, errors = {}, {}
+    requests = {}
+
+    for req_id, tk in enumerate(tickers, start=1):
+        if not app.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            errors[tk] = "timed out waiting for a free market data line"
+            continue
+        bucket.acquire()
+        with app.lock:
+            app.done[req_id] = threading.Event()
+        requests[req_id] = tk
+        app.reqMktData(req_id, stock_contract(tk), "", True, False, [])
+
+    for req_id, tk in requests.items():
+        if not app.done[req_id].wait(timeout=max(0.0, deadline - time.monotonic())):
+            app._finish(req_id)
+        price = app.last.get(req_id) or app.close.get(req_id)
+        if price:
+            prices[tk] = price
+        elif req_id in app.errors:
+            code, message = app.errors[req_id]
+            errors[tk] = f"[{code}] {message}"
+        else:
+            errors[tk] = "no price in snapshot"
+
+    app.disconnect()
+    thread.join(timeout=2)
+
+    return prices, errors
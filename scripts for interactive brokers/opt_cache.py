@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+
+OPT_CACHE_DIR = "optimizer_cache"
+OPT_CACHE_MAX_ENTRIES = 20_000
+OPT_CACHE_EVICT_TO = 0.9       # eviction trims the cache to this fraction of max_entries
+
+
+class OptimizerCache:
+    """Content-addressed on-disk cache of optimizer outputs.
+
+    Each entry is one small JSON file named by a hash of everything the solution
+    depends on: the expected return vector (so the momentum window and the
+    fundamentals snapshot), the covariance matrix (so the window bounds and
+    estimator), the group memberships and the constraint parameters. Hits touch
+    the file. The entry count is kept in memory; once it passes ``max_entries``
+    one directory scan evicts the least recently used entries down to
+    ``evict_to`` of the cap, so most puts never scan.
+    """
+
+    def __init__(self, root=OPT_CACHE_DIR, max_entries=OPT_CACHE_MAX_ENTRIES, evict_to=OPT_CACHE_EVICT_TO):
+        self.root = root
+        self.max_entries = max_entries
+        self.evict_to = evict_to
+        self.hits = self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.entries = sum(1 for e in os.scandir(root) if e.name.endswith(".json"))
+
+    @staticmethod
+    def fingerprint(mu, S, groups, **params):
+        digest = hashlib.blake2b(digest_size=20)
+        labels = [[str(tk) for tk in mu.index], [sorted(str(tk) for tk in g) for g in groups], params]
+        digest.update(json.dumps(labels, sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(mu.to_numpy(dtype='float64')).tobytes())
+        digest.update(np.ascontiguousarray(np.asarray(S, dtype='float64')).tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return OrderedDict(zip(entry['tickers'], entry['weights']))
+
+    def put(self, key, weights):
+        path = self._path(key)
+        new = not os.path.exists(path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'tickers': [str(tk) for tk in weights], 'weights': [float(w) for w in weights.values()]}, f)
+        os.replace(tmp_path, path)
+        self.entries += new
+        if self.entries > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        # Other processes may share the directory, so recount before trimming
+        entries = [e for e in os.scandir(self.root) if e.name.endswith(".json")]
+        keep = int(self.max_entries * self.evict_to)
+        self.entries = len(entries)
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - keep]:
+            try:
+                os.remove(entry.path)
+                self.entries -= 1
+            except OSError:
+                pass
+
+    def cached(self, key, solve):
+        """Return the cached weights for ``key``, or call ``solve()`` and store its result."""
+        weights = self.get(key)
+        if weights is None:
+            weights = solve()
+            self.put(key, weights)
+        return weights
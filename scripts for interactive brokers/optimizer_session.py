@@ -0,0 +1,140 @@
+import logging
+from collections import OrderedDict
+import cvxpy as cp
+import numpy as np
+from data_fetcher import MAX_ASSET_WEIGHT, MIN_GROUP_WEIGHT
+
+
+N_GROUPS = 3        # small caps, large caps, ETFs
+
+logger = logging.getLogger(__name__)
+
+
+class OptimizerSession:
+    """Max-Sharpe problem compiled once for a fixed asset universe and re-solved many times.
+
+    Solves the same transformed problem as EfficientFrontier.max_sharpe with
+    weight_bounds (0, max_weight) and the group minimums, but mu, the covariance
+    and the group membership are cvxpy Parameters: each call only updates them
+    and re-solves with warm start. Assets missing from a call's mu get an upper
+    bound of zero, so a changing universe never forces a rebuild.
+
+    With a ``turnover_penalty`` or ``max_turnover`` the session is trade-aware:
+    ``solve`` takes the current weights and maximizes the Sharpe ratio of the
+    expected return net of ``turnover_penalty`` per unit of weight traded,
+    subject to a one-way turnover of at most ``max_turnover``. Both stay
+    homogeneous in (y, k), so the problem is still convex and compiled once.
+    """
+
+    def __init__(self, assets, max_weight=MAX_ASSET_WEIGHT, min_group_weight=MIN_GROUP_WEIGHT, solver=None,
+                 turnover_penalty=0.0, max_turnover=None):
+        self.assets = list(assets)
+        self.position = {tk: i for i, tk in enumerate(self.assets)}
+        self.max_weight = max_weight
+        self.min_group_weight = min_group_weight
+        self.solver = solver
+        self.turnover_penalty = turnover_penalty
+        self.max_turnover = max_turnover
+        self.trade_aware = turnover_penalty > 0 or max_turnover is not None
+        n = len(self.assets)
+
+        self.mu = cp.Parameter(n)
+        self.cov_root = cp.Parameter((n, n))     # S = R @ R.T keeps the objective DPP
+        self.upper = cp.Parameter(n, nonneg=True)
+        self.groups = cp.Parameter((N_GROUPS, n), nonneg=True)
+        self.group_min = cp.Parameter(N_GROUPS, nonneg=True)
+
+        # Variable substitution from max_sharpe: y = k * w with mu @ y == 1
+        self.y = cp.Variable(n)
+        self.k = cp.Variable()
+        constraints = [
+            self.mu @ self.y == 1,
+            cp.sum(self.y) == self.k,
+            self.k >= 0,
+            self.y >= 0,
+            self.y <= cp.multiply(self.upper, self.k),
+            self.groups @ self.y >= self.group_min * self.k,
+        ]
+        if self.trade_aware:
+            # trades = k * (w - w_current); the return constraint becomes mu.w - penalty * |trades|_1
+            self.current = cp.Parameter(n, nonneg=True)
+            self.penalty = cp.Parameter(nonneg=True)
+            self.turnover_limit = cp.Parameter(nonneg=True)
+            self.trades = cp.Variable(n)
+            constraints[0] = self.mu @ self.y - self.penalty * cp.norm1(self.trades) >= 1
+            constraints += [self.trades == self.y - cp.multiply(self.current, self.k),
+                            0.5 * cp.norm1(self.trades) <= self.turnover_limit * self.k]
+        self.problem = cp.Problem(cp.Minimize(cp.sum_squares(self.cov_root.T @ self.y)), constraints)
+        self.solves = 0
+
+    def _set_current(self, current):
+        # No current weights (e.g. the opening allocation): nothing to pay for or limit
+        weights = np.zeros(len(self.assets))
+        if current is not None:
+            for tk, w in current.items():
+                if tk in self.position and w > 0:
+                    weights[self.position[tk]] = w
+        self.current.value = weights
+        self.penalty.value = self.turnover_penalty if current is not None else 0.0
+        limited = current is not None and self.max_turnover is not None
+        self.turnover_limit.value = self.max_turnover if limited else 1.0     # 1.0 never binds
+
+    def _set_parameters(self, mu, S, groups):
+        n = len(self.assets)
+        idx = np.array([self.position[tk] for tk in mu.index])
+
+        mu_full = np.zeros(n)
+        mu_full[idx] = mu.to_numpy(dtype='float64')
+        self.mu.value = mu_full
+
+        # Symmetric square root via eigh: exact for singular (PSD) covariances too
+        vals, vecs = np.linalg.eigh(np.asarray(S, dtype='float64'))
+        root = np.zeros((n, n))
+        root[np.ix_(idx, idx)] = vecs * np.sqrt(np.clip(vals, 0.0, None))
+        self.cov_root.value = root
+
+        upper = np.zeros(n)
+        upper[idx] = self.max_weight
+        self.upper.value = upper
+
+        members = np.zeros((N_GROUPS, n))
+        group_min = np.zeros(N_GROUPS)
+        universe = set(mu.index)
+        for g, group in enumerate(groups):
+            cols = [self.position[tk] for tk in group if tk in universe]
+            if cols:
+                members[g, cols] = 1.0
+                group_min[g] = self.min_group_weight
+        self.groups.value = members
+        self.group_min.value = group_min
+
+    def solve(self, mu, S, groups=(), current=None):
+        """Return cleaned weights (OrderedDict over ``mu.index``) like ef.clean_weights().
+
+        ``S`` must be aligned to ``mu.index``; ``groups`` is a sequence of up to
+        three ticker lists that must each hold at least ``min_group_weight``.
+        ``current`` ({ticker: weight}) is only used by a trade-aware session.
+        """
+        if mu.max() <= 0:
+            raise ValueError("at least one of the assets must have an expected return exceeding the risk-free rate")
+        self._set_parameters(mu, S, groups)
+        if self.trade_aware:
+            self._set_current(current)
+        self.problem.solve(solver=self.solver, warm_start=True)
+        self.solves += 1
+        infeasible = self.problem.status in (cp.INFEASIBLE, cp.INFEASIBLE_INACCURATE)
+        if self.trade_aware and infeasible and self.turnover_limit.value < 1.0:
+            # The turnover cap cannot reach a portfolio that meets the other rules; trade as far as needed
+            logger.warning("No portfolio within %.0f%% turnover meets the constraints; lifting the cap",
+                           100 * self.max_turnover)
+            self.turnover_limit.value = 1.0
+            self.problem.solve(solver=self.solver, warm_start=True)
+            self.solves += 1
+        if self.problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self.y.value is None:
+            raise ValueError(f"Optimization failed with status {self.problem.status}")
+
+        idx = np.array([self.position[tk] for tk in mu.index])
+        weights = self.y.value[idx] / self.k.value
+        weights[np.abs(weights) < 1e-4] = 0
+        weights = np.round(weights, 5) + 0.0
+        return OrderedDict(zip(mu.index, weights))
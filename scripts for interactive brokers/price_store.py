@@ -0,0 +1,113 @@
+import json
+import os
+import pandas as pd
+
+
+CACHE_DIR = "price_cache"
+# Relative tolerance when comparing a re-fetched bar with the cached one.
+# Adjusted series are rescaled after dividends/splits, so a mismatch on the
+# overlapping bar means the cached history is stale and must be re-downloaded.
+ADJUSTMENT_TOLERANCE = 1e-4
+
+
+class PriceStore:
+    """Local close-price cache, one Parquet partition per (symbol, bar size, whatToShow).
+
+    A manifest records the date range each partition was fetched for, so callers
+    can tell "the ticker did not trade yet" apart from "we never asked".
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, "manifest.json")
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+
+    @staticmethod
+    def key(symbol, bar_size, what_to_show):
+        return f"{symbol}__{bar_size.replace(' ', '')}__{what_to_show}"
+
+    def path(self, symbol, bar_size, what_to_show):
+        return os.path.join(self.root, self.key(symbol, bar_size, what_to_show) + ".parquet")
+
+    def load(self, symbol, bar_size, what_to_show):
+        path = self.path(symbol, bar_size, what_to_show)
+        if not os.path.exists(path):
+            return None
+        series = pd.read_parquet(path)['close']
+        series.name = symbol
+        return series
+
+    def coverage(self, symbol, bar_size, what_to_show):
+        entry = self.manifest.get(self.key(symbol, bar_size, what_to_show))
+        if entry is None or not os.path.exists(self.path(symbol, bar_size, what_to_show)):
+            return None, None
+        return pd.Timestamp(entry['covered_from']), pd.Timestamp(entry['covered_to'])
+
+    def covers(self, symbol, bar_size, what_to_show, start):
+        covered_from, _ = self.coverage(symbol, bar_size, what_to_show)
+        return covered_from is not None and covered_from <= pd.Timestamp(start)
+
+    def save(self, symbol, bar_size, what_to_show, series, covered_from, covered_to):
+        frame = pd.DataFrame({'close': series.astype('float64')})
+        frame.index = pd.to_datetime(frame.index)
+        frame.index.name = 'timestamp'
+        frame.sort_index().to_parquet(self.path(symbol, bar_size, what_to_show))
+
+        self.manifest[self.key(symbol, bar_size, what_to_show)] = {
+            'covered_from': str(pd.Timestamp(covered_from).date()),
+            'covered_to': str(pd.Timestamp(covered_to).date()),
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def extend(self, symbol, bar_size, what_to_show, new_bars, covered_to):
+        """Append freshly fetched bars to the cached partition.
+
+        ``new_bars`` must overlap the last cached bar. Returns the combined series,
+        or None if the overlap disagrees (history was re-adjusted) and the caller
+        needs to fetch the full range again.
+        """
+        cached = self.load(symbol, bar_size, what_to_show)
+        covered_from, _ = self.coverage(symbol, bar_size, what_to_show)
+        new_bars = new_bars.copy()
+        new_bars.index = pd.to_datetime(new_bars.index)
+        new_bars = new_bars.sort_index()
+
+        overlap = cached.index.intersection(new_bars.index)
+        if len(overlap) == 0:
+            return None
+        old, new = cached.loc[overlap], new_bars.loc[overlap]
+        if ((old - new).abs() > ADJUSTMENT_TOLERANCE * old.abs()).any():
+            return None
+
+        combined = pd.concat([cached[cached.index < new_bars.index[0]], new_bars])
+        self.save(symbol, bar_size, what_to_show, combined, covered_from, covered_to)
+        return combined
+
+    def merge(self, symbol, bar_size, what_to_show, bars, covered_from, covered_to):
+        """Save a full re-download without losing older cached bars it does not reach.
+
+        Cached bars before the first new bar are kept, rescaled to the new
+        adjustment at the first bar both share; without a shared bar they cannot
+        be aligned and are dropped. Returns the saved series.
+        """
+        cached = self.load(symbol, bar_size, what_to_show)
+        bars = bars.copy()
+        bars.index = pd.to_datetime(bars.index)
+        bars = bars.sort_index()
+        overlap = pd.DatetimeIndex([]) if cached is None else cached.index.intersection(bars.index)
+        if len(overlap) == 0 or cached.index[0] >= bars.index[0] or cached.loc[overlap[0]] == 0:
+            self.save(symbol, bar_size, what_to_show, bars, covered_from, covered_to)
+            return bars
+        older = cached[cached.index < bars.index[0]] * (bars.loc[overlap[0]] / cached.loc[overlap[0]])
+        combined = pd.concat([older, bars])
+        cached_from, _ = self.coverage(symbol, bar_size, what_to_show)
+        self.save(symbol, bar_size, what_to_show, combined, min(pd.Timestamp(covered_from), cached_from), covered_to)
+        return combined
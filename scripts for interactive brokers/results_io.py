@@ -0,0 +1,96 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+RESULTS_DIR = "backtest_results"
+FORMAT_VERSION = 1
+
+
+class BacktestResults:
+    """A saved run: dates, portfolio values, rebalance flags and the date x asset weights.
+
+    ``weights`` is a (memory-mapped) float32 array, or a scipy CSR matrix for
+    runs saved with ``sparse=True``. ``series`` holds any other per-date
+    arrays saved with the run (e.g. cash, costs, turnover).
+    """
+
+    def __init__(self, dates, assets, values, weights, rebalanced, series=None):
+        self.dates = dates
+        self.assets = assets
+        self.values = values
+        self.weights = weights
+        self.rebalanced = rebalanced
+        self.series = series or {}
+
+    @property
+    def dense_weights(self):
+        return self.weights.toarray() if sp.issparse(self.weights) else np.asarray(self.weights)
+
+    def value_series(self):
+        return pd.Series(self.values, index=self.dates, name='PortfolioValue')
+
+    def weights_frame(self):
+        return pd.DataFrame(self.dense_weights, index=self.dates, columns=self.assets)
+
+    def allocations(self, assets=None):
+        """Date / PortfolioValue / per-asset percentage table, as in backtest_allocations.csv."""
+        weights = self.weights_frame()
+        if assets is not None:
+            weights = weights.reindex(columns=list(assets), fill_value=0.0)
+        # Percentages are formatted from the stored float32 weights
+        table = pd.DataFrame(np.char.mod('%.2f%%', weights.to_numpy(dtype='float64') * 100),
+                             columns=weights.columns)
+        table.insert(0, 'PortfolioValue', self.values)
+        table.insert(0, 'Date', self.dates.strftime('%Y-%m-%d'))
+        return table
+
+
+# Function to save a run as a directory of .npy arrays plus a small JSON manifest
+# Every array is written raw, so loading is np.load(..., mmap_mode='r') with no parsing.
+# Extra keyword arrays (one value per date) are saved as float64 series.
+def save_results(dates, assets, values, weights, rebalanced=None, path=RESULTS_DIR, sparse=False, **series):
+    os.makedirs(path, exist_ok=True)
+    dates = pd.DatetimeIndex(dates)
+    weights = np.asarray(weights, dtype='float32')
+    rebalanced = np.zeros(len(dates), dtype=bool) if rebalanced is None else np.asarray(rebalanced, dtype=bool)
+
+    np.save(os.path.join(path, "dates.npy"), dates.values.astype('datetime64[ns]'))
+    np.save(os.path.join(path, "values.npy"), np.asarray(values, dtype='float64'))
+    np.save(os.path.join(path, "rebalanced.npy"), rebalanced)
+    if sparse:
+        matrix = sp.csr_matrix(weights)
+        np.save(os.path.join(path, "weights_data.npy"), matrix.data)
+        np.save(os.path.join(path, "weights_indices.npy"), matrix.indices.astype('int32'))
+        np.save(os.path.join(path, "weights_indptr.npy"), matrix.indptr.astype('int64'))
+    else:
+        np.save(os.path.join(path, "weights.npy"), weights)
+    for name, array in series.items():
+        np.save(os.path.join(path, f"series_{name}.npy"), np.asarray(array, dtype='float64'))
+
+    manifest = {'version': FORMAT_VERSION, 'assets': [str(a) for a in assets],
+                'shape': list(weights.shape), 'sparse': bool(sparse), 'series': sorted(series)}
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return path
+
+
+# Function to load a saved run; arrays are memory-mapped unless mmap=False
+def load_results(path=RESULTS_DIR, mmap=True):
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    mode = 'r' if mmap else None
+
+    def array(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mode)
+
+    if manifest['sparse']:
+        weights = sp.csr_matrix((array("weights_data"), array("weights_indices"), array("weights_indptr")),
+                                shape=tuple(manifest['shape']))
+    else:
+        weights = array("weights")
+    series = {name: array(f"series_{name}") for name in manifest.get('series', [])}
+    return BacktestResults(pd.DatetimeIndex(array("dates")), pd.Index(manifest['assets']),
+                           array("values"), weights, array("rebalanced"), series)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+
+class RollingWindow:
+    """Sliding row window over one contiguous date x asset price array.
+
+    Windows are basic slices of the array, so no prices are copied. The number of
+    priced rows per column is kept up to date from the rows that enter and
+    leave the window, so the completeness filter costs O(N) per step instead
+    of a dropna over the whole T x N window.
+    """
+
+    def __init__(self, prices):
+        self.index = prices.index
+        self.columns = prices.columns
+        self.values = np.ascontiguousarray(prices.to_numpy(dtype='float64'))
+        self.valid = ~np.isnan(self.values)
+        # Last priced row at or before each row (-1 before the first price), for forward-filled lookups
+        rows = np.where(self.valid, np.arange(len(self.values))[:, None], -1)
+        self.last_valid = np.maximum.accumulate(rows, axis=0)
+        self.start = self.end = 0
+        self.counts = np.zeros(self.values.shape[1], dtype='int64')
+
+    def __len__(self):
+        return self.end - self.start
+
+    def move(self, start, end):
+        """Slide the window to rows [start, end)."""
+        if start < self.start or end < self.end or start >= self.end:
+            self.counts = self.valid[start:end].sum(axis=0)
+        else:
+            self.counts += self.valid[self.end:end].sum(axis=0)
+            self.counts -= self.valid[self.start:start].sum(axis=0)
+        self.start, self.end = start, end
+        return self
+
+    def get_state(self):
+        return {'start': self.start, 'end': self.end, 'counts': self.counts}
+
+    def set_state(self, state):
+        self.start, self.end = int(state['start']), int(state['end'])
+        self.counts = np.array(state['counts'], dtype='int64')
+        return self
+
+    @property
+    def view(self):
+        return self.values[self.start:self.end]
+
+    def frame(self):
+        """The window as a DataFrame sharing the array's memory."""
+        return pd.DataFrame(self.view, index=self.index[self.start:self.end], columns=self.columns, copy=False)
+
+    def complete(self, min_coverage):
+        """Columns priced on at least ``min_coverage`` of the window's rows (dropna(thresh=...))."""
+        return self.counts >= int(min_coverage * len(self))
+
+    def _filled(self, row):
+        # Price at ``row`` forward-filled from earlier rows of the window
+        source = self.last_valid[row]
+        found = source >= self.start
+        prices = np.full(len(self.columns), np.nan)
+        prices[found] = self.values[source[found], np.flatnonzero(found)]
+        return prices
+
+    def momentum(self, periods):
+        """Last row of ``frame().pct_change(periods)`` (gaps forward-filled), computed from two rows."""
+        last = self.end - 1
+        if last - periods < self.start:
+            return pd.Series(np.nan, index=self.columns)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = self._filled(last) / self._filled(last - periods) - 1
+        return pd.Series(change, index=self.columns)
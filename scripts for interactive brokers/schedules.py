@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from backtest_engine import BacktestEngine, simulate_schedules
+from analytics import batch_summary
+from data_fetcher import MAX_ASSET_WEIGHT, MOMENTUM_WINDOW
+
+COMPARISON_RESULTS = "strategy_comparison.csv"
+TOP_N = 20
+COST_BPS = 5.0          # flat cost on traded notional for every strategy
+
+# Each builder returns a rebalance x asset weight matrix over prices.columns for
+# the price rows in ``rows``; stack them with simulate_schedules to compare.
+
+
+def month_starts(dates):
+    """Row positions of the first trading day of each month."""
+    periods = pd.DatetimeIndex(dates).to_period('M')
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def equal_weight(prices, rows):
+    priced = prices.to_numpy(dtype='float64')[rows] > 0
+    return priced / np.maximum(priced.sum(axis=1, keepdims=True), 1)
+
+
+def cap_weight(market_caps, rows, max_weight=MAX_ASSET_WEIGHT, iterations=20):
+    caps = np.nan_to_num(market_caps.to_numpy(dtype='float64')[rows]).clip(0, None)
+    weights = caps / np.maximum(caps.sum(axis=1, keepdims=True), 1e-12)
+    # Clip at the cap and hand the excess to the uncapped names, pro rata
+    for _ in range(iterations):
+        excess = np.clip(weights - max_weight, 0, None).sum(axis=1, keepdims=True)
+        if not excess.any():
+            break
+        weights = np.minimum(weights, max_weight)
+        room = np.where(weights < max_weight, weights, 0.0)
+        weights += excess * room / np.maximum(room.sum(axis=1, keepdims=True), 1e-12)
+    return weights
+
+
+def momentum_top_n(prices, rows, n=TOP_N, lookback=MOMENTUM_WINDOW):
+    values = prices.ffill().to_numpy(dtype='float64')
+    weights = np.zeros((len(rows), values.shape[1]))
+    past = np.asarray(rows) - lookback
+    ok = past >= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        momentum = values[rows[ok]] / values[past[ok]] - 1
+    momentum = np.where(np.isfinite(momentum), momentum, -np.inf)
+    top = np.argsort(-momentum, axis=1)[:, :n]
+    chosen = np.zeros_like(momentum, dtype=bool)
+    np.put_along_axis(chosen, top, True, axis=1)
+    chosen &= np.isfinite(momentum)
+    weights[ok] = chosen / np.maximum(chosen.sum(axis=1, keepdims=True), 1)
+    return weights
+
+
+def optimizer_weights(engine, rows):
+    """The engine's optimizer targets on each row; a failed rebalance keeps the previous target."""
+    weights = np.zeros((len(rows), len(engine.assets)))
+    for j, i in enumerate(rows):
+        target = engine.target_weights(i)
+        if target is not None:
+            weights[j] = target
+        elif j > 0:
+            weights[j] = weights[j - 1]
+    return weights
+
+
+# Function to backtest several schedules on the same prices and tabulate their metrics
+# ``schedules`` maps a strategy name to its rebalance x asset weight matrix.
+def compare_schedules(prices, rows, schedules, initial_capital, cost_bps=COST_BPS):
+    names = list(schedules)
+    tensor = np.stack([schedules[name] for name in names])
+    values, turnover = simulate_schedules(prices, rows, tensor, initial_capital, cost_bps)
+    daily = np.zeros(values.shape)
+    daily[:, rows] = turnover
+    return batch_summary(values, daily, names=names), pd.DataFrame(values.T, index=prices.index, columns=names)
+
+
+def main():
+    from backtester import load_backtest_inputs, ETF_TICKERS, INITIAL_CAPITAL, COVARIANCE_METHOD
+    prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask = load_backtest_inputs()
+    engine = BacktestEngine(prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask, ETF_TICKERS,
+                            INITIAL_CAPITAL, covariance_method=COVARIANCE_METHOD, verbose=False)
+    rows = month_starts(prices.index)
+    schedules = {
+        'optimizer': optimizer_weights(engine, rows),
+        'equal_weight': equal_weight(prices, rows),
+        'cap_weight': cap_weight(market_caps, rows),
+        f'momentum_top{TOP_N}': momentum_top_n(prices, rows),
+    }
+    table, curves = compare_schedules(prices, rows, schedules, INITIAL_CAPITAL)
+    table.to_csv(COMPARISON_RESULTS, index_label='strategy')
+    print(table.to_string())
+    print(f"Comparison of {len(schedules)} strategies over {len(rows)} rebalances saved to {COMPARISON_RESULTS}.")
+
+
+if __name__ == "__main__":
+    main()
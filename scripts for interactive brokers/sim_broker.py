@@ -0,0 +1,198 @@
+import contextlib
+import io
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from ibapi.execution import Execution
+from ibapi.commission_report import CommissionReport
+from costs import CostModel, IBTieredCosts
+from trader import create_contract, rebalance_portfolio, MIN_TRADE_VALUE
+
+
+SIM_ACCOUNT = "SIM0001"
+
+
+class SimClient:
+    """Stand-in for the EClient calls trader.py makes, answered by a SimBroker.
+
+    Mixed in ahead of an EWrapper/EClient app class (see SimBroker.app), it
+    answers every request synchronously through the app's own EWrapper
+    callbacks. connect() reports nextValidId and run() returns at once, so
+    trader's thread start/join pattern works unchanged.
+    """
+
+    broker = None
+
+    def connect(self, host, port, clientId):
+        self.clientId = clientId
+        self._sim_connected = True
+        self.nextValidId(self.broker.next_order_id)
+
+    def isConnected(self):
+        return getattr(self, '_sim_connected', False)
+
+    def run(self):
+        pass
+
+    def disconnect(self):
+        self._sim_connected = False
+
+    def reqAccountSummary(self, reqId, groupName, tags):
+        values = {'NetLiquidation': self.broker.net_liquidation(), 'TotalCashValue': self.broker.cash}
+        for tag in tags.split(','):
+            if tag in values:
+                self.accountSummary(reqId, self.broker.account, tag, f"{values[tag]:.2f}", "USD")
+        self.accountSummaryEnd(reqId)
+
+    def reqPositions(self):
+        for symbol, qty in self.broker.positions.items():
+            if qty != 0:
+                self.position(self.broker.account, create_contract(symbol), Decimal(qty),
+                              self.broker.avg_cost.get(symbol, 0.0))
+        self.positionEnd()
+
+    def placeOrder(self, orderId, contract, order):
+        fill = self.broker.execute(orderId, contract, order)
+        if fill is None:
+            return
+        execution, report = fill
+        self.orderStatus(orderId, "Filled", execution.shares, Decimal(0), execution.price, execution.permId,
+                         0, execution.price, self.clientId, "", 0.0)
+        self.execDetails(-1, contract, execution)
+        self.commissionReport(report)
+
+
+class SimBroker:
+    """In-process simulated account for replaying trader.py over history.
+
+    Holds cash and whole-share positions. ``set_prices`` gives the bars of the
+    current date: market orders fill immediately at them, and positions are
+    valued at the last price seen. The spread and impact of the ``cost_model``
+    are paid in the fill price and its commission is reported through
+    commissionReport. As in a cash account, a buy the cash cannot pay for is
+    clipped to the shares it can, or rejected if that is none.
+    """
+
+    def __init__(self, cash, cost_model=None, account=SIM_ACCOUNT):
+        self.cash = float(cash)
+        self.cost_model = cost_model or CostModel()
+        self.account = account
+        self.positions = {}
+        self.avg_cost = {}
+        self.quotes = {}        # today's bars, used for fills
+        self.marks = {}         # last known price per symbol, used for valuation
+        self.adv = {}
+        self.time = None
+        self.next_order_id = 1
+        self.executions = []
+        self._apps = {}
+
+    def app(self, app_class):
+        """An instance of ``app_class`` whose EClient calls go to this broker."""
+        sim_class = self._apps.get(app_class)
+        if sim_class is None:
+            sim_class = type(f"Sim{app_class.__name__}", (SimClient, app_class), {'broker': self})
+            self._apps[app_class] = sim_class
+        return sim_class()
+
+    def set_prices(self, prices, time=None, adv=None, marks=None):
+        self.quotes = {tk: p for tk, p in prices.items() if p == p}     # drop NaN
+        self.marks.update(self.quotes if marks is None else marks)
+        self.time = time
+        self.adv = adv or {}
+
+    def net_liquidation(self):
+        return self.cash + sum(qty * self.marks.get(tk, 0.0) for tk, qty in self.positions.items())
+
+    def _costs(self, symbol, signed_qty, price):
+        trades, prices = np.array([signed_qty], dtype='float64'), np.array([price])
+        adv = np.array([self.adv[symbol]]) if symbol in self.adv else None
+        if isinstance(self.cost_model, IBTieredCosts):
+            commission = float(self.cost_model.commissions(trades, prices)[0])
+            slippage = float(self.cost_model.spread(trades, prices)[0] + self.cost_model.impact(trades, prices, adv)[0])
+        else:
+            commission, slippage = self.cost_model.total(trades, prices, adv), 0.0
+        return commission, slippage
+
+    def execute(self, order_id, contract, order):
+        symbol = contract.symbol
+        price = self.quotes.get(symbol)
+        if price is None or price <= 0:
+            print(f"[WARN] No price for {symbol}; order {order_id} not filled")
+            return None
+        qty = int(order.totalQuantity)
+        signed = qty if order.action == "BUY" else -qty
+        commission, slippage = self._costs(symbol, signed, price)
+        if signed > 0 and qty * price + slippage + commission > self.cash:
+            while qty > 0 and qty * price + slippage + commission > self.cash:
+                qty = min(qty - 1, int(qty * self.cash / (qty * price + slippage + commission)))
+                if qty > 0:
+                    commission, slippage = self._costs(symbol, qty, price)
+            if qty <= 0:
+                print(f"[WARN] Insufficient cash for {symbol}; order {order_id} rejected")
+                return None
+            print(f"[WARN] Insufficient cash for {symbol}; order {order_id} clipped to {qty} shares")
+            signed = qty
+        fill_price = price + np.sign(signed) * slippage / qty
+
+        held = self.positions.get(symbol, 0)
+        if signed > 0:
+            cost = self.avg_cost.get(symbol, 0.0) * held + fill_price * qty
+            self.avg_cost[symbol] = cost / (held + qty)
+        self.positions[symbol] = held + signed
+        if self.positions[symbol] == 0:
+            self.positions.pop(symbol)
+            self.avg_cost.pop(symbol, None)
+        self.cash -= signed * fill_price + commission
+
+        execution = Execution()
+        execution.execId = f"sim.{order_id}"
+        execution.time = str(self.time or "")
+        execution.acctNumber = self.account
+        execution.exchange = "SIM"
+        execution.side = "BOT" if signed > 0 else "SLD"
+        execution.shares = Decimal(qty)
+        execution.cumQty = Decimal(qty)
+        execution.price = execution.avgPrice = float(fill_price)
+        execution.orderId = execution.permId = order_id
+        report = CommissionReport()
+        report.execId = execution.execId
+        report.commission = commission
+        report.currency = "USD"
+
+        self.next_order_id = max(self.next_order_id, order_id + 1)
+        self.executions.append({'time': self.time, 'symbol': symbol, 'side': execution.side, 'shares': qty,
+                                'price': execution.price, 'commission': commission, 'cost': commission + slippage})
+        return execution, report
+
+    def rebalance(self, target_allocations, min_trade_value=MIN_TRADE_VALUE, verbose=True):
+        """Run trader.rebalance_portfolio against this account at today's prices; returns the costs paid.
+
+        Only symbols with a target or a position are passed on, sells first so
+        that their proceeds are in cash before the buys. ``verbose=False``
+        silences trader's console output; the simulated calls all run on this
+        thread, so nothing else is caught.
+        """
+        first = len(self.executions)
+        value = self.net_liquidation()
+        held = {tk: qty * self.marks.get(tk, 0.0) / value for tk, qty in self.positions.items()} if value > 0 else {}
+        targets = {tk: w for tk, w in target_allocations.items() if w != 0 or held.get(tk, 0) != 0}
+        targets = dict(sorted(targets.items(), key=lambda item: item[1] - held.get(item[0], 0.0)))
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+            rebalance_portfolio(targets, self.quotes, broker=self, min_trade_value=min_trade_value)
+        return sum(e['cost'] for e in self.executions[first:])
+
+
+# Function to replay trader.rebalance_portfolio over a price history
+# ``schedule`` maps dates to target allocations; the account is marked on every
+# date. trader's console output is shown only with ``verbose``. Returns the daily
+# NetLiquidation series and a table of executions.
+def replay(prices, schedule, initial_capital, cost_model=None, verbose=False):
+    broker = SimBroker(initial_capital, cost_model)
+    values = np.full(len(prices), np.nan)
+    for i, (date, row) in enumerate(zip(prices.index, prices.to_numpy(dtype='float64'))):
+        broker.set_prices(dict(zip(prices.columns, row)), time=date)
+        if date in schedule:
+            broker.rebalance(schedule[date], verbose=verbose)
+        values[i] = broker.net_liquidation()
+    return pd.Series(values, index=prices.index, name='NetLiquidation'), pd.DataFrame(broker.executions)
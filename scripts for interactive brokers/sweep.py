@@ -0,0 +1,117 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from backtest_engine import run_backtest
+from covariance import CovarianceEngine
+from analytics import summarize
+
+SWEEP_RESULTS = "sweep_results.csv"
+MAX_WORKERS = os.cpu_count() or 1
+
+# Every combination of these values is backtested once
+PARAM_GRID = {
+    'momentum_lookback': [63, 126, 252],
+    'factor_weights': [{'momentum': 0.8, 'value': 0.2}, {'momentum': 0.5, 'value': 0.5}, {'momentum': 1.0, 'value': 0.0}],
+    'max_weight': [0.15, 0.20, 0.25],
+    'min_group_weight': [0.05, 0.10],
+}
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+# ------------ Shared memory ------------
+
+class SharedFrames:
+    """Date x ticker matrices copied once into shared memory blocks.
+
+    Workers attach to the blocks by name and wrap them in DataFrames without
+    copying, so a configuration never pickles the price or fundamentals data.
+    The creating process owns the blocks and must call ``close()``.
+    """
+
+    def __init__(self, frames):
+        first = next(iter(frames.values()))
+        self.index, self.columns = first.index, first.columns
+        self.blocks, self.spec = {}, {}
+        for name, frame in frames.items():
+            array = np.ascontiguousarray(frame.reindex(index=self.index, columns=self.columns).to_numpy())
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            self.blocks[name] = block
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+
+_worker = {}
+
+
+def _attach(spec, index, columns, base_params):
+    frames = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)    # keep the mapping alive for the worker's lifetime
+        frames[name] = pd.DataFrame(np.ndarray(shape, np.dtype(dtype), buffer=block.buf),
+                                    index=index, columns=columns, copy=False)
+    _worker.update(blocks=blocks, frames=frames, base_params=base_params,
+                   cov_engine=CovarianceEngine.from_prices(frames['prices']))
+
+
+def _run_config(params):
+    f = _worker['frames']
+    engine = run_backtest(f['prices'], f['market_caps'], f['pe_ratios'], f['small_caps'], f['large_caps'],
+                          **{**_worker['base_params'], **params},
+                          cov_engine=_worker['cov_engine'], verbose=False)
+    metrics = {name: np.asarray(v).item() for name, v in summarize(engine.values, engine.turnover).items()}
+    return {'final_value': engine.values[-1], **metrics, 'rebalances': int(engine.rebalanced.sum()),
+            'costs': engine.trading_costs.sum()}
+
+
+# Function to backtest every configuration of a parameter grid on a process pool
+# Returns one row per configuration with its parameters and summary metrics.
+def sweep(prices, market_caps, pe_ratios, small_cap_mask, large_cap_mask, etf_tickers, initial_capital,
+          grid=None, max_workers=MAX_WORKERS, cost_model=None):
+    configs = expand_grid(grid or PARAM_GRID)
+    base_params = {'etf_tickers': list(etf_tickers), 'initial_capital': initial_capital, 'cost_model': cost_model}
+    shared = SharedFrames({'prices': prices, 'market_caps': market_caps, 'pe_ratios': pe_ratios,
+                           'small_caps': small_cap_mask, 'large_caps': large_cap_mask})
+    rows = [None] * len(configs)
+    print(f"[INFO] Sweeping {len(configs)} configurations on {max_workers} workers...")
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(shared.spec, shared.index, shared.columns, base_params)) as pool:
+            futures = {pool.submit(_run_config, params): i for i, params in enumerate(configs)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    rows[i] = {**configs[i], **future.result()}
+                except Exception as e:
+                    print(f"[WARN] Configuration {configs[i]} failed: {e}")
+                    rows[i] = {**configs[i], 'error': str(e)}
+    finally:
+        shared.close()
+    return pd.DataFrame(rows)
+
+
+def main():
+    from backtester import load_backtest_inputs, ETF_TICKERS, INITIAL_CAPITAL, COST_MODEL
+    inputs = load_backtest_inputs()
+    table = sweep(*inputs, ETF_TICKERS, INITIAL_CAPITAL, cost_model=COST_MODEL)
+    table.to_csv(SWEEP_RESULTS, index=False)
+    print(table.sort_values('sharpe', ascending=False).to_string(index=False))
+    print(f"Sweep complete; results saved to {SWEEP_RESULTS}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from ibapi.order import Order
 import threading
 import time
 
+MIN_TRADE_VALUE = 0.0       # skip orders worth less than this many dollars (closing a position always trades)
+
 
 # ------------ Net Liquidation ------------
 
@@ -32,8 +34,9 @@ class AccountApp(EWrapper, EClient):
         self.done_event.set()
 
 
-def get_account_value():
-    app = AccountApp()
+# Pass a sim_broker.SimBroker as broker to run the same code against a simulated account
+def get_account_value(broker=None):
+    app = broker.app(AccountApp) if broker else AccountApp()
     app.connect("127.0.0.1", 7497, clientId=1001)
 
     thread = threading.Thread(target=app.run, daemon=True)
@@ -72,8 +75,8 @@ class PositionsApp(EWrapper, EClient):
         self.done_event.set()
 
 
-def get_positions():
-    app = PositionsApp()
+def get_positions(broker=None):
+    app = broker.app(PositionsApp) if broker else PositionsApp()
     app.connect("127.0.0.1", 7497, clientId=998)
 
     thread = threading.Thread(target=app.run, daemon=True)
@@ -90,6 +93,16 @@ def get_positions():
     return app.positions
 
 
+# Function to read the account's current weights {symbol: weight} at the given prices
+# The weights are position values over NetLiquidation; what is left over is cash.
+def get_current_weights(current_prices, broker=None):
+    capital = get_account_value(broker)
+    if capital <= 0:
+        return {}
+    return {symbol: float(qty) * current_prices[symbol] / capital
+            for symbol, qty, _ in get_positions(broker) if current_prices.get(symbol, 0) > 0}
+
+
 # ------------ Rebalancing Logic ------------
 
 class TraderApp(EWrapper, EClient):
@@ -97,12 +110,21 @@ class TraderApp(EWrapper, EClient):
         EClient.__init__(self, self)
         self.nextOrderId = None
         self.connected_event = threading.Event()
+        self.fills = []
+        self.commissions = {}
 
     def nextValidId(self, orderId: int):
         self.nextOrderId = orderId
         print(f"[DEBUG] Next valid order ID: {orderId}")
         self.connected_event.set()
 
+    def execDetails(self, reqId, contract, execution):
+        print(f"[FILL] {execution.side} {execution.shares} {contract.symbol} @ ${execution.price:.2f}")
+        self.fills.append((contract.symbol, execution.side, float(execution.shares), execution.price, execution.execId))
+
+    def commissionReport(self, commissionReport):
+        self.commissions[commissionReport.execId] = commissionReport.commission
+
 
 def create_contract(symbol):
     contract = Contract()
@@ -124,9 +146,10 @@ def create_order(action, quantity):
 
 
 
-def rebalance_portfolio(target_allocations, current_prices):
-    capital = get_account_value()
-    positions = dict((symbol, qty) for symbol, qty, _ in get_positions())
+# Returns the fills reported through execDetails as (symbol, side, shares, price, execId)
+def rebalance_portfolio(target_allocations, current_prices, broker=None, min_trade_value=MIN_TRADE_VALUE):
+    capital = get_account_value(broker)
+    positions = dict((symbol, qty) for symbol, qty, _ in get_positions(broker))
     print(f"\n[INFO] Current capital: ${capital:.2f}")
     print(f"[INFO] Current positions: {positions}")
 
@@ -137,7 +160,7 @@ def rebalance_portfolio(target_allocations, current_prices):
             target_qty = int((capital * weight) / price)
             target_shares[symbol] = target_qty
 
-    app = TraderApp()
+    app = broker.app(TraderApp) if broker else TraderApp()
     app.connect("127.0.0.1", 7497, clientId=999)
 
     thread = threading.Thread(target=app.run, daemon=True)
@@ -153,6 +176,9 @@ def rebalance_portfolio(target_allocations, current_prices):
         if delta == 0:
             print(f"[INFO] No change needed for {symbol}")
             continue
+        if target_qty != 0 and float(abs(delta)) * current_prices[symbol] < min_trade_value:
+            print(f"[INFO] Skipping {symbol}: trade of {abs(delta)} shares is below ${min_trade_value:,.0f}")
+            continue
 
         action = "BUY" if delta > 0 else "SELL"
         quantity = abs(delta)
@@ -162,8 +188,11 @@ def rebalance_portfolio(target_allocations, current_prices):
         order = create_order(action, quantity)
         app.placeOrder(order_id, contract, order)
         order_id += 1
-        time.sleep(1)
+        if broker is None:
+            time.sleep(1)
 
-    time.sleep(2)
+    if broker is None:
+        time.sleep(2)
     app.disconnect()
     thread.join(timeout=2)
+    return app.fills